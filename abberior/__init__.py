@@ -1,2 +1,13 @@
+import importlib
 
-from . import microscope, user, utils
+# Submodules are imported on first access, e.g. `abberior.utils`, such that
+# importing the package does not pull in specpy, matplotlib or scipy
+_SUBMODULES = ("microscope", "user", "utils")
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def __dir__():
+    return sorted(list(globals()) + list(_SUBMODULES))
@@ -17,7 +17,20 @@ def find(_dict, element):
     """
     if not element:
         return _dict    
-    return reduce(operator.getitem, element.split("/"), _dict)
+    return reduce(getitem, element.split("/"), _dict)
+
+def getitem(item, key):
+    """
+    Returns an element from a `dict` or from a `list` using a `str` key
+
+    :param item: A `dict` or a `list`
+    :param key: A `str` of the key or of the index
+
+    :returns : The element at the desired key
+    """
+    if isinstance(item, list):
+        key = int(key)
+    return item[key]
 
 def nested_set(_dict, keys, value, create_missing=False):
     """
@@ -33,13 +46,17 @@ def nested_set(_dict, keys, value, create_missing=False):
     d = _dict
     keys = keys.split("/")
     for key in keys[:-1]:
-        if key in d:
+        if isinstance(d, list):
+            d = d[int(key)]
+        elif key in d:
             d = d[key]
         elif create_missing:
             d = d.setdefault(key, {})
         else:
             return _dict
-    if keys[-1] in d or create_missing:
+    if isinstance(d, list):
+        d[int(keys[-1])] = value
+    elif keys[-1] in d or create_missing:
         d[keys[-1]] = value
     return _dict
 
@@ -161,6 +178,29 @@ class Measurement:
         """
         return self.configs[0]
 
+    def configuration(self, item):
+        """
+        Gets a configuration by position or by name
+
+        :param item: An `int` of the position or a `str` of the name
+
+        :returns : A `Config`
+        """
+        if isinstance(item, int):
+            return self.configs[item]
+        for conf in self.configs:
+            if conf.name() == item:
+                return conf
+        raise KeyError(item)
+
+    def configuration_names(self):
+        """
+        Gets the names of the configurations
+
+        :returns : A `list` of names
+        """
+        return [conf.name() for conf in self.configs]
+
     def clone(self, conf):
         """
         Clone the configuration object and adds it to the current `Measurement`
@@ -175,12 +215,14 @@ class Measurement:
 
     def save_as(self, savepath, compress=False):
         """
-        Saves the current measurement. This is not implemented.
+        Saves the current measurement. Only the names of the configurations are
+        written.
 
         :param savepath: A `str` of the saving path
         :param compress: A `bool` wheter to compress the data
         """
-        return
+        with open(savepath, "w") as file:
+            yaml.dump({"configurations" : self.configuration_names()}, file)
 
     def __repr__(self):
         """
@@ -209,6 +251,22 @@ class Imspector:
         """
         return Measurement()
 
+    def open(self, path):
+        """
+        Opens a saved measurement. The content of the file is not loaded.
+
+        :param path: A `str` of the path of the measurement
+
+        :returns : A `Measurement`
+        """
+        return Measurement()
+
+    def close(self, measurement):
+        """
+        Closes a measurement
+        """
+        pass
+
 if __name__ == "__main__":
 
     im = Imspector()
@@ -0,0 +1,202 @@
+'''
+This module implements a job scheduler to share the microscope between
+several experiments of a process.
+
+A job is an iterable of steps, typically a generator that yields after every
+acquisition. The scheduler runs one step at a time and may switch to another
+job between two steps, i.e. at acquisition boundaries.
+'''
+
+import itertools
+import threading
+import time
+
+from concurrent.futures import Future
+
+class Job:
+    '''Implements the handle of a submitted job.
+    '''
+    def __init__(self, steps, priority, user, name, index):
+        self.steps = iter(steps)
+        self.priority = priority
+        self.user = user
+        self.name = name
+        self.index = index
+        self.state = "queued"
+        self.results = []
+        self.elapsed = 0.
+        self.preemptions = 0
+        self.future = Future()
+
+    def result(self, timeout=None):
+        '''Waits for the job and returns the results of its steps.
+
+        :param timeout: The maximal waiting time (seconds).
+
+        :returns: A `list` of the results of the steps.
+        '''
+        return self.future.result(timeout)
+
+    def done(self):
+        return self.future.done()
+
+    def __repr__(self):
+        return "Job(name={!r}, user={!r}, priority={}, state={!r}, steps={})".format(
+            self.name, self.user, self.priority, self.state, len(self.results))
+
+class JobScheduler:
+    '''Runs the jobs of several users on the microscope.
+
+    The next step is always taken from the job with the highest priority. Among
+    jobs of equal priority, the user who used the microscope the least is
+    favoured (fair share) and the jobs of a user are run in submission order.
+    A running job is preempted between two steps when another job is favoured.
+
+    Usage::
+
+        scheduler = JobScheduler()
+        mosaic = scheduler.submit(microscope.tile_job(conf, area), user="bob")
+        calibration = scheduler.submit(acquisition_job([conf]), priority=10, user="alice")
+        stacks, elapsed = calibration.result()[0]
+    '''
+    def __init__(self):
+        self._queue = []
+        self._usage = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="job-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, steps, priority=0, user="default", name=None):
+        '''Queues a job.
+
+        :param steps: An iterable of steps. Each step is the result of `next`
+                      or, if it is callable, the result of calling it.
+        :param priority: An `int` of the priority, larger runs first.
+        :param user: A `str` of the user of the job.
+        :param name: A `str` of the name of the job.
+
+        :returns: A `Job`.
+        '''
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot submit to a closed JobScheduler.")
+            index = next(self._counter)
+            job = Job(steps, priority, user, name if name is not None else "job-{}".format(index), index)
+            self._usage.setdefault(user, 0.)
+            self._queue.append(job)
+            self._condition.notify()
+        return job
+
+    def cancel(self, job):
+        '''Removes a job from the queue. A job is cancelled at its next step
+        boundary.
+
+        :param job: A `Job`.
+
+        :returns: A `bool` whether the job was cancelled.
+        '''
+        with self._condition:
+            if job not in self._queue:
+                return False
+            self._queue.remove(job)
+            job.state = "cancelled"
+            job.future.cancel()
+            return True
+
+    def depth(self, user=None):
+        '''Returns the number of jobs that are queued, preempted or running.
+
+        :param user: A `str` of a user, otherwise all the jobs are counted.
+
+        :returns: An `int`.
+        '''
+        with self._condition:
+            return sum(1 for job in self._queue if user is None or job.user == user)
+
+    def status(self):
+        '''Returns the state of the queue.
+
+        :returns: A `dict` with the jobs in the order they would be run and the
+                  time used per user (seconds).
+        '''
+        with self._condition:
+            jobs = sorted(self._queue, key=self._key)
+            return {
+                "jobs" : [{"name" : job.name, "user" : job.user, "priority" : job.priority,
+                           "state" : job.state, "steps" : len(job.results), "elapsed" : job.elapsed}
+                          for job in jobs],
+                "usage" : dict(self._usage),
+            }
+
+    def _key(self, job):
+        return (-job.priority, self._usage[job.user], job.index)
+
+    def _run(self):
+        current = None
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                job = min(self._queue, key=self._key)
+                if current is not None and current is not job and current in self._queue:
+                    current.state = "preempted"
+                    current.preemptions += 1
+                job.state = "running"
+                current = job
+
+            start = time.perf_counter()
+            try:
+                step = next(job.steps)
+                if callable(step):
+                    step = step()
+            except StopIteration:
+                self._finish(job, "done")
+                continue
+            except BaseException as err:
+                self._finish(job, "failed", err)
+                continue
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._condition:
+                    job.elapsed += elapsed
+                    self._usage[job.user] += elapsed
+            job.results.append(step)
+
+    def _finish(self, job, state, error=None):
+        with self._condition:
+            if job in self._queue:
+                self._queue.remove(job)
+            if job.future.cancelled():
+                return
+            job.state = state
+        if error is None:
+            job.future.set_result(job.results)
+        else:
+            job.future.set_exception(error)
+
+    def close(self, wait=True):
+        '''Stops accepting jobs. The queued jobs are still run.
+
+        :param wait: A `bool` whether to wait for the queued jobs.
+        '''
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if wait:
+            self._thread.join()
+
+def acquisition_job(configs):
+    '''Creates a job that acquires the configurations one after the other.
+
+    :param configs: An iterable of configuration objects.
+
+    :returns: A generator of steps, each returning the result of
+              `microscope.acquire`.
+    '''
+    from . import microscope
+    for conf in configs:
+        yield lambda conf=conf : microscope.acquire(conf)
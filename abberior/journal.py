@@ -0,0 +1,235 @@
+'''
+This module implements a journal of the calls made to Imspector and their
+replay, e.g. against the debug `Imspector` to profile or test a script offline.
+
+The journal is an append-only binary file of length-prefixed pickled records.
+'''
+
+import itertools
+import os
+import pickle
+import struct
+import threading
+import time
+
+import numpy
+
+_HEADER = struct.Struct("<I")
+# Values that are recorded as is, other returned objects are wrapped
+PLAIN_TYPES = (type(None), bool, int, float, complex, str, bytes, list, tuple, dict, numpy.ndarray, numpy.generic)
+# Methods whose first argument is a path of the filesystem
+FILE_METHODS = ("save_as", "open")
+
+class Journal:
+    '''Appends the records of the calls to a binary file.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "ab")
+        self._lock = threading.Lock()
+        self._refs = itertools.count()
+        self.closed = False
+
+    def new_ref(self):
+        '''Returns a new object reference.
+
+        :returns: An `int`.
+        '''
+        return next(self._refs)
+
+    def write(self, record):
+        '''Appends a record to the journal. Nothing is written once the journal
+        is closed.
+
+        :param record: A `dict`.
+        '''
+        try:
+            data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            record = dict(record, args=tuple(map(_picklable, record.get("args", ()))),
+                          kwargs={key : _picklable(value) for key, value in record.get("kwargs", {}).items()})
+            data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if self.closed:
+                return
+            self._file.write(_HEADER.pack(len(data)))
+            self._file.write(data)
+            self._file.flush()
+
+    def register(self, name):
+        '''Records a root object, e.g. the application or the measurement.
+
+        :param name: A `str` of the name of the root object.
+
+        :returns: An `int` of the reference of the object.
+        '''
+        ref = self.new_ref()
+        self.write({"root" : name, "ref" : ref, "time" : time.time()})
+        return ref
+
+    def close(self):
+        '''Closes the journal.
+        '''
+        with self._lock:
+            self.closed = True
+            self._file.close()
+
+def _picklable(value):
+    try:
+        pickle.dumps(value)
+        return value
+    except Exception:
+        return repr(value)
+
+class Reference:
+    '''Implements a reference to a journaled object in the arguments of a record.
+    '''
+    __slots__ = ("ref",)
+
+    def __init__(self, ref):
+        self.ref = ref
+
+    def __repr__(self):
+        return "Reference({})".format(self.ref)
+
+class JournalProxy:
+    '''Forwards the method calls to an object and records them in a journal.
+    Objects returned by the calls, e.g. configurations, are also proxied.
+    Once the journal is closed, the calls are forwarded without recording.
+    '''
+    def __init__(self, target, journal, ref):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_journal", journal)
+        object.__setattr__(self, "_ref", ref)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        def method(*args, **kwargs):
+            start = time.perf_counter()
+            result = attribute(*[unwrap(arg) for arg in args],
+                               **{key : unwrap(value) for key, value in kwargs.items()})
+            if self._journal.closed:
+                return result
+            latency = time.perf_counter() - start
+            result_ref = None
+            if not isinstance(result, PLAIN_TYPES):
+                result_ref = self._journal.new_ref()
+                result = JournalProxy(result, self._journal, result_ref)
+            self._journal.write({
+                "ref" : self._ref, "method" : name,
+                "args" : tuple(_encode(arg) for arg in args),
+                "kwargs" : {key : _encode(value) for key, value in kwargs.items()},
+                "result" : result_ref, "latency" : latency, "time" : time.time(),
+            })
+            return result
+        return method
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __repr__(self):
+        return repr(self._target)
+
+def unwrap(value):
+    '''Returns the object behind a `JournalProxy`.
+
+    :param value: A `JournalProxy` or any object.
+
+    :returns: The proxied object or `value` itself.
+    '''
+    return value._target if isinstance(value, JournalProxy) else value
+
+def _encode(value):
+    return Reference(value._ref) if isinstance(value, JournalProxy) else value
+
+def read(path):
+    '''Reads the records of a journal.
+
+    :param path: A `str` of the path of the journal.
+
+    :returns: A generator of `dict` records.
+    '''
+    with open(path, "rb") as file:
+        while True:
+            header = file.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                break
+            size, = _HEADER.unpack(header)
+            data = file.read(size)
+            if len(data) < size:
+                break
+            yield pickle.loads(data)
+
+def replay(path, im=None, strict=False, outdir=None):
+    '''Replays a journal at full speed.
+
+    The calls reading or writing files (`FILE_METHODS`) are skipped such that
+    the files of the recording, e.g. the saved measurements, are never
+    overwritten. When `outdir` is given, they are replayed with their paths
+    moved to this directory instead.
+
+    :param path: A `str` of the path of the journal.
+    :param im: The application on which the calls are replayed. Defaults to the
+               debug `Imspector`.
+    :param strict: A `bool` whether to raise on the first failing call. Failing
+                   calls are otherwise counted and skipped.
+    :param outdir: A `str` of the directory to which the files are written.
+
+    :returns: A `dict` with the number of calls, errors and skipped calls, the
+              recorded and replayed durations (seconds) and the count per
+              method.
+    '''
+    if im is None:
+        from .debug import Imspector
+        im = Imspector()
+    if outdir is not None:
+        os.makedirs(outdir, exist_ok=True)
+
+    objects = {}
+    skipped = set()
+    stats = {"calls" : 0, "errors" : 0, "skipped" : 0, "recorded" : 0., "replayed" : 0., "methods" : {}}
+    for record in read(path):
+        if "root" in record:
+            if record["root"] == "application":
+                objects[record["ref"]] = im
+            elif record["root"] == "measurement":
+                objects[record["ref"]] = im.active_measurement()
+            continue
+
+        def decode(value):
+            return objects.get(value.ref) if isinstance(value, Reference) else value
+
+        stats["calls"] += 1
+        stats["recorded"] += record["latency"]
+        stats["methods"][record["method"]] = stats["methods"].get(record["method"], 0) + 1
+        args = list(record["args"])
+        refs = {record["ref"]}.union(value.ref for value in args + list(record["kwargs"].values())
+                                     if isinstance(value, Reference))
+        is_file = record["method"] in FILE_METHODS and bool(args) and isinstance(args[0], str)
+        if (is_file and outdir is None) or skipped.intersection(refs):
+            # The objects returned by skipped calls are skipped as well
+            stats["skipped"] += 1
+            if record["result"] is not None:
+                skipped.add(record["result"])
+            continue
+        if is_file:
+            args[0] = os.path.join(outdir, os.path.basename(args[0]))
+
+        start = time.perf_counter()
+        try:
+            target = objects[record["ref"]]
+            result = getattr(target, record["method"])(
+                *[decode(arg) for arg in args],
+                **{key : decode(value) for key, value in record["kwargs"].items()})
+        except Exception:
+            if strict:
+                raise
+            stats["errors"] += 1
+            result = None
+        stats["replayed"] += time.perf_counter() - start
+        if record["result"] is not None:
+            objects[record["result"]] = result
+    return stats
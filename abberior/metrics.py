@@ -0,0 +1,141 @@
+'''
+This module implements an in-process registry of timing records.
+'''
+
+import json
+import threading
+import time
+
+from collections import deque
+
+import numpy
+
+class MetricsRegistry:
+    '''Stores the timing records of the acquisitions by name. Each record is a
+    `dict` of phase durations (seconds) with optional metadata. Only the last
+    `maxlen` records of each name are kept.
+    '''
+    def __init__(self, maxlen=10000):
+        self.maxlen = maxlen
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, **values):
+        '''Adds a timing record.
+
+        :param name: A `str` of the name of the record, e.g. "acquire".
+        :param values: The phase durations (seconds) and metadata of the record.
+
+        :returns: The record.
+        '''
+        values.setdefault("timestamp", time.time())
+        with self._lock:
+            if name not in self._records:
+                self._records[name] = deque(maxlen=self.maxlen)
+            self._records[name].append(values)
+        return values
+
+    def names(self):
+        '''Returns the names of the recorded metrics.
+
+        :returns: A `list` of `str`.
+        '''
+        with self._lock:
+            return list(self._records)
+
+    def records(self, name):
+        '''Returns the records of a name.
+
+        :param name: A `str` of the name of the records.
+
+        :returns: A `list` of `dict`.
+        '''
+        with self._lock:
+            return list(self._records.get(name, []))
+
+    def values(self, name, phase):
+        '''Returns the values of a phase.
+
+        :param name: A `str` of the name of the records.
+        :param phase: A `str` of the phase, e.g. "run".
+
+        :returns: A `numpy.ndarray` of the values.
+        '''
+        return numpy.array([record[phase] for record in self.records(name) if phase in record], dtype=float)
+
+    def percentiles(self, name, phase, q=(50, 90, 99)):
+        '''Computes the percentiles of a phase.
+
+        :param name: A `str` of the name of the records.
+        :param phase: A `str` of the phase.
+        :param q: A sequence of percentiles in [0, 100].
+
+        :returns: A `dict` mapping the percentiles to their values.
+        '''
+        values = self.values(name, phase)
+        if values.size == 0:
+            return {p : None for p in q}
+        return dict(zip(q, numpy.percentile(values, q).tolist()))
+
+    def histogram(self, name, phase, bins=10):
+        '''Computes the histogram of a phase.
+
+        :param name: A `str` of the name of the records.
+        :param phase: A `str` of the phase.
+        :param bins: The bins passed to `numpy.histogram`.
+
+        :returns: A `tuple` of the counts and bin edges.
+        '''
+        return numpy.histogram(self.values(name, phase), bins=bins)
+
+    def summary(self):
+        '''Summarizes the phases of every recorded name.
+
+        :returns: A nested `dict` {name: {phase: statistics}}.
+        '''
+        summary = {}
+        for name in self.names():
+            records = self.records(name)
+            # Durations are stored as `float`, other values are metadata
+            phases = sorted({key for record in records for key, value in record.items()
+                             if key != "timestamp" and isinstance(value, float)})
+            summary[name] = {}
+            for phase in phases:
+                values = self.values(name, phase)
+                p50, p90, p99 = numpy.percentile(values, (50, 90, 99)).tolist()
+                summary[name][phase] = {
+                    "count" : int(values.size),
+                    "mean" : float(values.mean()),
+                    "min" : float(values.min()),
+                    "max" : float(values.max()),
+                    "p50" : p50,
+                    "p90" : p90,
+                    "p99" : p99,
+                }
+        return summary
+
+    def dump(self, path, records=False):
+        '''Writes the summary, and optionally the records, to a JSON file.
+
+        :param path: A `str` of the path of the file.
+        :param records: A `bool` whether to include every record.
+        '''
+        data = {"summary" : self.summary()}
+        if records:
+            data["records"] = {name : self.records(name) for name in self.names()}
+        with open(path, "w") as file:
+            json.dump(data, file, indent=2, default=str)
+
+    def clear(self, name=None):
+        '''Removes the records.
+
+        :param name: A `str` of the name of the records. Every record is
+                     removed if `None`.
+        '''
+        with self._lock:
+            if name is None:
+                self._records.clear()
+            else:
+                self._records.pop(name, None)
+
+registry = MetricsRegistry()
@@ -4,24 +4,266 @@ This module implements wrapper functions to access and modify easily the STED
 parameters through specpy.
 '''
 
+import functools
+import inspect
+import json
+import os
+import threading
 import time
 import numpy
 import pickle
 
-try:
-    import specpy
-    # from specpy import Imspector
-    # im = Imspector()
-    im = specpy.get_application()
-    measurement = im.active_measurement()
-except (ModuleNotFoundError, RuntimeError) as err:
-    print(err)
-    print("Calling these functions might raise an error.")
-    print("\nFalling back to the debug files...")
-
-    from .debug import Imspector
-    im = Imspector()
-    measurement = im.active_measurement()
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from . import journal, planning, rescue, snapshots, utils
+from .metrics import registry
+from .parameters import ConfigTransaction, CachedConfiguration, ConfigurationPool, apply_parameters
+from .stacks import StackIndex
+
+# Fraction of the bracket at which golden-section steps are taken
+GOLDEN = (3 - 5 ** 0.5) / 2
+
+# Time (seconds) spent by `im.run` outside of the scan itself. The run time
+# recorded in `metrics.registry` can be used to calibrate this value.
+DEAD_TIME = 0.08
+
+_local = threading.local()
+
+class _LockedProxy:
+    '''Forwards the method calls to an object while holding the lock of a
+    session. Objects returned by the calls, e.g. configurations, are also
+    proxied such that every call to Imspector is serialized.
+    '''
+    def __init__(self, target, lock):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_lock", lock)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        def method(*args, **kwargs):
+            with self._lock:
+                result = attribute(*[_unlock(arg) for arg in args],
+                                   **{key : _unlock(value) for key, value in kwargs.items()})
+            if not isinstance(result, journal.PLAIN_TYPES):
+                result = _LockedProxy(result, self._lock)
+            return result
+        return method
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __repr__(self):
+        return repr(self._target)
+
+def _unlock(value):
+    return value._target if isinstance(value, _LockedProxy) else value
+
+class Session:
+    '''Holds a connection to Imspector and the state of the acquisitions made
+    through it, i.e. the journal, the pools of buffers and clones, the
+    indices of the stacks and the executor of the asynchronous acquisitions.
+
+    Every call to the application, the measurement or the configurations of a
+    session holds its `lock`, and acquisitions hold it from the activation to
+    the fetch of the stacks. Threads may thus share a session while only the
+    calls to Imspector are serialized.
+
+    The functions of this module are available as methods and act on the
+    session they are called from. The module-level functions act on the
+    session entered on the current thread (`with session:`) or on
+    `default_session`.
+
+    Usage::
+
+        session = Session()
+        conf = session.get_measurement().active_configuration()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(session.acquire, conf) for _ in range(4)]
+    '''
+    def __init__(self, application=None, measurement=None):
+        self.lock = threading.RLock()
+        self.buffers = {}
+        self.configuration_pool = None
+        self.stack_indices = {}
+        self._targets = (application, measurement)
+        self._application = None
+        self._measurement = None
+        self._journal = None
+        self._acquisition_executor = None
+
+    def _bind(self, application, measurement):
+        if self._journal is not None:
+            application = journal.JournalProxy(application, self._journal, self._journal.register("application"))
+            measurement = journal.JournalProxy(measurement, self._journal, self._journal.register("measurement"))
+        self._application = _LockedProxy(application, self.lock)
+        self._measurement = _LockedProxy(measurement, self.lock)
+
+    def connect(self):
+        '''Connect to Imspector through specpy and fetch its active measurement.
+        Falls back to the debug `Imspector` if specpy is not available.
+
+        :returns: The application and the measurement.
+        '''
+        application, measurement = self._targets
+        if application is None:
+            try:
+                import specpy
+                application = specpy.get_application()
+            except (ModuleNotFoundError, RuntimeError) as err:
+                print(err)
+                print("Calling these functions might raise an error.")
+                print("\nFalling back to the debug files...")
+
+                from .debug import Imspector
+                application = Imspector()
+        if measurement is None:
+            measurement = application.active_measurement()
+        with self.lock:
+            self._bind(application, measurement)
+        return self._application, self._measurement
+
+    def reconnect(self):
+        '''Drop the current connection and connect again, e.g. after restarting
+        Imspector or changing its active measurement. The pools of clones and
+        buffers and the indices of the stacks, which refer to the previous
+        measurement, are dropped.
+
+        :returns: The application and the measurement.
+        '''
+        with self.lock:
+            self._application, self._measurement = None, None
+            self.configuration_pool = None
+            self.stack_indices = {}
+            self.buffers = {}
+            return self.connect()
+
+    def get_application(self):
+        '''Fetch the Imspector application, connecting if needed.
+
+        :returns: The application.
+        '''
+        if self._application is None:
+            self.connect()
+        return self._application
+
+    def get_measurement(self):
+        '''Fetch the measurement on which the session acts, connecting if needed.
+
+        :returns: The measurement.
+        '''
+        if self._measurement is None:
+            self.connect()
+        return self._measurement
+
+    def start_journal(self, path):
+        '''Start recording every call made to Imspector in an append-only binary
+        journal. The configurations fetched from the measurement after this call
+        are also recorded. The journal can be replayed with `journal.replay`.
+
+        :param path: A `str` of the path of the journal.
+        '''
+        with self.lock:
+            if self._journal is not None:
+                raise RuntimeError("A journal is already recording to {}".format(self._journal.path))
+            application = _unlock(self.get_application())
+            measurement = _unlock(self.get_measurement())
+            self._journal = journal.Journal(path)
+            self._bind(application, measurement)
+
+    def stop_journal(self):
+        '''Stop recording the calls made to Imspector.
+        '''
+        with self.lock:
+            if self._journal is None:
+                return
+            application = journal.unwrap(_unlock(self._application))
+            measurement = journal.unwrap(_unlock(self._measurement))
+            self._journal.close()
+            self._journal = None
+            self._bind(application, measurement)
+
+    def acquisition_executor(self):
+        '''Returns the executor on which the asynchronous acquisitions are run.
+        A single worker so that queued acquisitions run back-to-back in order.
+        '''
+        with self.lock:
+            if self._acquisition_executor is None:
+                self._acquisition_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="acquisition")
+            return self._acquisition_executor
+
+    def close(self):
+        '''Waits for the queued acquisitions and stops the journal.
+        '''
+        if self._acquisition_executor is not None:
+            self._acquisition_executor.shutdown(wait=True)
+            self._acquisition_executor = None
+        self.stop_journal()
+
+    def __enter__(self):
+        if not hasattr(_local, "sessions"):
+            _local.sessions = []
+        _local.sessions.append(self)
+        return self
+
+    def __exit__(self, *args):
+        _local.sessions.pop()
+
+default_session = Session()
+
+def current_session():
+    '''Fetch the session on which the module-level functions act, i.e. the
+    innermost session entered on the current thread or `default_session`.
+
+    :returns: A `Session`.
+    '''
+    sessions = getattr(_local, "sessions", None)
+    return sessions[-1] if sessions else default_session
+
+def connect():
+    '''Connect the current session to Imspector (see `Session.connect`).
+    '''
+    return current_session().connect()
+
+def reconnect():
+    '''Reconnect the current session to Imspector (see `Session.reconnect`).
+    '''
+    return current_session().reconnect()
+
+def get_application():
+    '''Fetch the Imspector application of the current session.
+    '''
+    return current_session().get_application()
+
+def get_measurement():
+    '''Fetch the measurement of the current session.
+    '''
+    return current_session().get_measurement()
+
+def __getattr__(name):
+    # `microscope.im` and `microscope.measurement` connect on first access
+    if name == "im":
+        return get_application()
+    if name == "measurement":
+        return get_measurement()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def start_journal(path):
+    '''Start recording the calls of the current session to Imspector (see
+    `Session.start_journal`).
+
+    :param path: A `str` of the path of the journal.
+    '''
+    current_session().start_journal(path)
+
+def stop_journal():
+    '''Stop recording the calls of the current session to Imspector.
+    '''
+    current_session().stop_journal()
 
 def get_config(message=None, image=None):
     '''Fetch and return the active configuration in Imspector.
@@ -34,52 +276,61 @@ def get_config(message=None, image=None):
         print(message)
     print("Manually select imaging configuration then press enter.")
     input()
-    return measurement.active_configuration()
+    return get_measurement().active_configuration()
 
-def acquire_multi_saveasmsr(configs, savepath):
+def acquire_multi_saveasmsr(configs, savepath, writer=None):
     '''Activate the given configuration and acquire an image stack.
 
     :param conf: A configuration object.
     :param savepath: a path to a file
+    :param writer: If defined, a `MeasurementWriter` to which the saving is
+                   queued instead of being done in line.
 
-    :return: An image stack (3d array) and the acquisition time (seconds).
+    :return: An image stack (3d array) and the acquisition time (seconds). When
+             a writer is given, the `Future` of the save is also returned.
     '''
-    for conf in configs:
-        measurement.activate(conf)
-        start = time.time()
-        im.run(measurement)
-        end = time.time()
-        print(end-start)
-        stacks = [conf.stack(i) for i in range(conf.number_of_stacks())]
-        x, y = get_offsets(conf)
-        print("Acquiring with configuration", conf.name(), "at offset x:", x, ", y:", y)
-    measurement.save_as(savepath, True)
-    # conf.stack(conf.name())
-    # chop the first 2 lines because of imaging problems I guess
-    # chop 0.08 seconds because life
-    return [[image[2:].copy() for image in stack.data()[0]] for stack in stacks], end - start - 0.08
-
-def acquire_multi(configs):
+    timings = []
+    with current_session().lock:
+        for conf in configs:
+            timing = {"configuration" : conf.name()}
+            _activate_and_run(conf, timing)
+            timings.append(timing)
+            x, y = get_offsets(conf)
+            print("Acquiring with configuration", conf.name(), "at offset x:", x, ", y:", y)
+        # conf.stack(conf.name())
+        # chop the first 2 lines because of imaging problems I guess
+        stacks = get_stacks(conf, crop=2, timing=timing)
+        snapshot = _save(savepath, writer, timing)
+    handle = None if writer is None else _queue_save(snapshot, savepath, writer)
+    for timing in timings:
+        registry.record("acquire_multi_saveasmsr", **timing)
+    if writer is not None:
+        return stacks, timing["run"] - DEAD_TIME, handle
+    return stacks, timing["run"] - DEAD_TIME
+
+def acquire_multi(configs, as_array=False, out=None, pooled=False):
     '''Activate the given configuration and acquire an image stack.
 
     :param conf: A configuration object.
-    :param savepath: a path to a file
+    :param as_array: If `True`, the stacks of each configuration are returned
+                     as a contiguous array (see `get_stacks`).
+    :param out: A `list` of arrays to fill, one per configuration.
+    :param pooled: If `True`, the arrays are taken from the buffer pool.
 
     :return: An image stack (3d array).
     '''
     finalstack = []
-    for conf in configs:
-        measurement.activate(conf)
-        start = time.time()
-        im.run(measurement)
-        end = time.time()
-        stacks = [conf.stack(i) for i in range(conf.number_of_stacks())]
-        finalstack.append([[image[2:].copy() for image in stack.data()[0]] for stack in stacks])
+    for i, conf in enumerate(configs):
+        timing = {"configuration" : conf.name()}
+        with current_session().lock:
+            _activate_and_run(conf, timing)
+            # chop the first 2 lines because of imaging problems I guess
+            finalstack.append(get_stacks(conf, crop=2, as_array=as_array,
+                                         out=None if out is None else out[i],
+                                         pooled=pooled, slot=i, timing=timing))
+        registry.record("acquire_multi", **timing)
         x, y = get_offsets(conf)
         print("Acquiring with configuration", conf.name(), "at offset x:", x, ", y:", y)
-    # conf.stack(conf.name())
-    # chop the first 2 lines because of imaging problems I guess
-    # chop 0.08 seconds because life
     return finalstack
 
 def clone(conf):
@@ -90,7 +341,121 @@ def clone(conf):
 
     :returns: A configuration object
     '''
-    return measurement.clone(conf)
+    return get_measurement().clone(conf)
+
+@contextmanager
+def pooled_clone(conf, parameters=None, maxsize=8):
+    '''Check out a clone of the configuration with the given parameters from
+    the pool of clones and release it at the end of the `with` block. A
+    released clone with the same parameters is reused and, once `maxsize`
+    clones exist, the least recently released one is re-parameterized by
+    minimal diff rather than creating a new configuration in the measurement.
+
+    Usage::
+
+        with pooled_clone(conf, {"ExpControl/scan/range/x/psz" : 20e-9}) as clone:
+            stacks, _ = acquire(clone)
+
+    :param conf: A configuration object used as a template.
+    :param parameters: A `dict` of path-like keys and values to apply.
+    :param maxsize: The maximal number of clones in the pool.
+
+    :returns: A configuration object
+    '''
+    session = current_session()
+    with session.lock:
+        if session.configuration_pool is None:
+            session.configuration_pool = ConfigurationPool(session.clone, maxsize=maxsize)
+        pool = session.configuration_pool
+        pool.maxsize = maxsize
+        clone = pool.checkout(conf, parameters)
+    try:
+        yield clone
+    finally:
+        with session.lock:
+            pool.release(clone)
+
+@contextmanager
+def batch(conf):
+    '''Gathers the parameter reads and writes of a configuration and commits
+    them on exit with one `set_parameters` call per written subtree. Nothing is
+    written if an exception is raised within the block.
+
+    Usage::
+
+        with batch(conf) as transaction:
+            set_rescue_strength(transaction, 5.0, 0)
+            set_LTh_thresholds(transaction, [10, 5], 0)
+
+    :param conf: A configuration object.
+
+    :returns: A `ConfigTransaction` to use in place of the configuration.
+    '''
+    transaction = ConfigTransaction(conf)
+    try:
+        yield transaction
+    except BaseException:
+        transaction.rollback()
+        raise
+    transaction.commit()
+
+def apply(conf, desired):
+    '''Set the desired parameters of a configuration by writing only the values
+    that differ from the current ones.
+
+    :param conf: A configuration object.
+    :param desired: A `dict` of path-like keys and their desired value. The
+                    values may be nested `dict`, in which case only the given
+                    keys are compared, e.g.
+                    `{"ExpControl/scan/range" : {"x" : {"off" : 0.0}}}`.
+
+    :returns: A `dict` mapping the written paths to their `(old, new)` values.
+    '''
+    return apply_parameters(conf, desired)
+
+def snapshot(conf, key="ExpControl", store=None):
+    '''Take a snapshot of the parameters of a configuration. The snapshot is
+    kept in a content-addressed store such that identical snapshots are only
+    stored once.
+
+    :param conf: A configuration object.
+    :param key: A path-like `str` of the parameters to snapshot.
+    :param store: A `SnapshotStore`. Defaults to `snapshots.store`.
+
+    :returns: A `str` of the identifier of the snapshot.
+    '''
+    if store is None:
+        store = snapshots.store
+    return store.put(key, conf.parameters(key))
+
+def restore(conf, snap, store=None):
+    '''Restore a snapshot in a configuration. Only the parameters that differ
+    from the snapshot are written (see `apply`).
+
+    :param conf: A configuration object.
+    :param snap: A `str` of the identifier of the snapshot.
+    :param store: A `SnapshotStore`. Defaults to `snapshots.store`.
+
+    :returns: A `dict` mapping the written paths to their `(old, new)` values.
+    '''
+    if store is None:
+        store = snapshots.store
+    key, value = store.get(snap)
+    return apply(conf, {key : value})
+
+def cached(conf, prefetch=("ExpControl/scan/range",)):
+    '''Wraps a configuration in a read-through cache. Repeated reads are served
+    from memory and the setters of this module invalidate the paths they write.
+
+    :param conf: A configuration object.
+    :param prefetch: Subtrees that are fetched at once. By default, the scan
+                     range which holds the geometry of the configuration.
+
+    :returns: A `CachedConfiguration` to use in place of the configuration.
+    '''
+    if isinstance(conf, CachedConfiguration):
+        return conf
+    return CachedConfiguration(conf, prefetch=prefetch)
 
 def get_num_channels(conf):
     '''Fetch and return the number of channels of a configuration object
@@ -204,15 +569,38 @@ def get_overview(conf, prefix="Overview ", name=None):
         overview = prefix + name
     else:
         overview = prefix + name
-    # print('overview')
 
-    # # There could be something similar to
-    for stack_name in conf.stack_names():
-        if name in stack_name:
-            break
-    return conf.stack(stack_name).data()[0][0]
+    index = get_stack_index(conf)
+    stack_name = overview if overview in index else index.find(name)
+    if stack_name is None:
+        raise KeyError("No stack matching {!r} in configuration {}".format(name, conf.name()))
+    return index.data([stack_name])[0]
 
-    # return conf.stack(overview).data()[0][0]
+def get_stack_index(conf):
+    '''Fetch the index of the stacks of a configuration. The index is kept per
+    configuration name and is rebuilt when the number of stacks changes.
+
+    :param conf: A configuration object.
+
+    :returns: A `StackIndex`.
+    '''
+    indices = current_session().stack_indices
+    index = indices.get(conf.name())
+    if index is None:
+        index = indices[conf.name()] = StackIndex(conf)
+    index.conf = conf
+    index.refresh()
+    return index
+
+def get_images(conf, names):
+    """Fetch the images of several stacks of a specific configuration.
+
+    :param conf: A configuration object.
+    :param names: A `list` of the names of the stacks.
+
+    :return: A `list` of images.
+    """
+    return get_stack_index(conf).data(names)
 
 def get_image(conf, name):
     """Fetch and return the image of a specific configuration.
@@ -303,14 +691,10 @@ def set_power(conf, power, laser_id,channel_id=0):
     :param laser_id: ID of the laser in Imspector (starting from 0).
     :param power: Power of the laser in [0, 1].
     '''
-    params = conf.parameters("ExpControl/measurement")
-
     if laser_id == 0:
         print('405 nm')
-        params["channels"][channel_id]["lasers"][laser_id]["power"]["calibrated"] = power*1e-3
-    else:
-        params["channels"][channel_id]["lasers"][laser_id]["power"]["calibrated"] = power
-    conf.set_parameters("ExpControl/measurement/channels", params["channels"])
+        power = power*1e-3
+    conf.set_parameters(f"ExpControl/measurement/channels/{channel_id}/lasers/{laser_id}/power/calibrated", power)
 
 def set_scan_axes(conf, axes):
     '''Set the scan axes of the configuration.
@@ -340,9 +724,7 @@ def activate_linestep(conf, status=True):
     :param conf: A configuration object.
     :param status: A `bool` to activate or deactivate the line step.
     """
-    params = conf.parameters("ExpControl/measurement")
-    params["line_steps"]["active"]=status
-    conf.set_parameters("ExpControl/measurement", params)
+    conf.set_parameters("ExpControl/measurement/line_steps/active", status)
 
 def activate_pixelstep(conf, status=True):
     """Activate the pixel step in a specific configuration.
@@ -350,9 +732,7 @@ def activate_pixelstep(conf, status=True):
     :param conf: A configuration object.
     :param status: A `bool` to activate or deactivate the pixel step.
     """
-    params = conf.parameters("ExpControl/measurement")
-    params["pixel_steps"]["active"]=status
-    conf.set_parameters("ExpControl/measurement", params)
+    conf.set_parameters("ExpControl/measurement/pixel_steps/active", status)
 
 def set_linestep(conf, linestep, step_id):
     '''Set the line step of a specific channel in a specific configuration.
@@ -669,49 +1049,756 @@ def set_rescue_mode(conf, mode, channel_id):
     channels = conf.parameters("ExpControl/measurement/channels")
     channels[channel_id]["rescue"]["rescue_mode"] = mode
     conf.set_parameters("ExpControl/measurement/channels", channels)
+
+def set_rescue_profile(conf, profile, channel_id):
+    """Apply a RESCue profile to a channel with at most two writes
+
+    :param conf: A configuration object
+    :param profile: A `rescue.RescueProfile` or the `str` name of a registered profile
+    :param channel_id: ID of the channel (Starting from 0)
+
+    :returns: A `dict` mapping the changed fields to their `(old, new)` values
+    """
+    if isinstance(profile, str):
+        profile = rescue.get_profile(profile)
+    return profile.apply(conf, channel_id)
 ###   End of RESCue parameters   ####
 
 
-def acquire(conf):
+def get_buffer(shape, dtype, slot=0):
+    '''Fetch a preallocated array from the buffer pool. The same array is
+    returned for the same shape, dtype and slot, such that its content is
+    overwritten by every pooled acquisition.
+
+    :param shape: A `tuple` of the shape of the array.
+    :param dtype: The dtype of the array.
+    :param slot: An `int` to keep several buffers of the same shape.
+
+    :returns: A `numpy.ndarray`.
+    '''
+    buffers = current_session().buffers
+    key = (tuple(shape), numpy.dtype(dtype).str, slot)
+    buffer = buffers.get(key)
+    if buffer is None:
+        buffer = numpy.empty(shape, dtype=dtype)
+        buffers[key] = buffer
+    return buffer
+
+def _activate_and_run(conf, timing):
+    '''Activate and run a configuration.
+
+    :param conf: A configuration object.
+    :param timing: A `dict` in which the durations (seconds) of the "activate"
+                   and "run" phases are stored.
+    '''
+    measurement = get_measurement()
+    start = time.perf_counter()
+    measurement.activate(conf)
+    timing["activate"] = time.perf_counter() - start
+    start = time.perf_counter()
+    get_application().run(measurement)
+    timing["run"] = time.perf_counter() - start
+
+def get_stacks(conf, crop=0, as_array=False, out=None, pooled=False, slot=0, timing=None):
+    '''Fetch the image stacks of a configuration after an acquisition.
+
+    By default, a nested `list` of copied frames is returned. When an array is
+    requested, the frames are copied once from the specpy buffers, which are
+    overwritten by the next acquisition, into a contiguous array of shape
+    (stacks, frames, height, width). Line cropping is done with views.
+
+    :param conf: A configuration object.
+    :param crop: The number of lines to remove at the top of the frames.
+    :param as_array: If `True`, a contiguous `numpy.ndarray` is returned.
+    :param out: A `numpy.ndarray` to fill. Implies `as_array`.
+    :param pooled: If `True`, the array is taken from the buffer pool (see
+                   `get_buffer`). Implies `as_array`.
+    :param slot: The slot of the buffer pool.
+    :param timing: A `dict` in which the durations (seconds) of the "fetch" and
+                   "copy" phases are stored.
+
+    :returns: A `list` of `list` of frames or a `numpy.ndarray`.
+    '''
+    if timing is None:
+        timing = {}
+    start = time.perf_counter()
+    data = [conf.stack(i).data()[0] for i in range(conf.number_of_stacks())]
+    timing["fetch"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if not as_array and out is None and not pooled:
+        stacks = [[image[crop:].copy() for image in frames] for frames in data]
+        timing["copy"] = time.perf_counter() - start
+        return stacks
+
+    frames = [numpy.asarray(frames)[:, crop:] for frames in data]
+    shape = (len(frames),) + frames[0].shape
+    for frame in frames:
+        if frame.shape != frames[0].shape:
+            raise ValueError("The stacks of configuration {} do not share the same shape: {} and {}".format(conf.name(), frames[0].shape, frame.shape))
+    if out is None:
+        if pooled:
+            out = get_buffer(shape, frames[0].dtype, slot=slot)
+        else:
+            out = numpy.empty(shape, dtype=frames[0].dtype)
+    elif out.shape != shape:
+        raise ValueError("The output array has shape {} but the stacks have shape {}".format(out.shape, shape))
+    for i, frame in enumerate(frames):
+        out[i] = frame
+    timing["copy"] = time.perf_counter() - start
+    return out
+
+def acquire(conf, as_array=False, out=None, pooled=False):
     '''Activate the given configuration and acquire an image stack.
 
     :param conf: A configuration object.
+    :param as_array: If `True`, the stacks are returned as a contiguous array of
+                     shape (stacks, frames, height, width).
+    :param out: A `numpy.ndarray` to fill with the stacks.
+    :param pooled: If `True`, the array is taken from the buffer pool and is
+                   overwritten by the next pooled acquisition.
 
     :return: An image stack (3d array) and the acquisition time (seconds).
     '''
-    measurement.activate(conf)
-    start = time.time()
-    im.run(measurement)
-    end = time.time()
-    stacks = [conf.stack(i) for i in range(conf.number_of_stacks())]
-    x, y = get_offsets(conf)
-    print("Acquiring with configuration", conf.name(), "at offset x:", x, ", y:", y)
+    timing = {"configuration" : conf.name()}
+    with current_session().lock:
+        _activate_and_run(conf, timing)
+        x, y = get_offsets(conf)
+        print("Acquiring with configuration", conf.name(), "at offset x:", x, ", y:", y)
 
-    #conf.stack(conf.name())
-    # chop the first 2 lines because of imaging problems I guess
-    # chop 0.08 seconds because life
-    return [[image.copy() for image in stack.data()[0]] for stack in stacks], end - start - 0.08
+        #conf.stack(conf.name())
+        stacks = get_stacks(conf, as_array=as_array, out=out, pooled=pooled, timing=timing)
+    registry.record("acquire", **timing)
+    return stacks, timing["run"] - DEAD_TIME
 
-def acquire_saveasmsr(conf,savepath):
+def acquire_frames(conf, buffer=4, crop=0):
+    '''Acquire the frames of a xyt configuration one at a time and yield each
+    frame as soon as it is acquired.
+
+    The frames do not come from a single running series: the configuration is
+    temporarily set to a single frame and activated and run once per frame.
+    Each frame thus has its own timing, i.e. the interval between two frames
+    is the scan time plus the activation and run dead time (see `DEAD_TIME`)
+    and the frame trigger and the time settings of the series do not apply.
+    `acquire` should be used when the timing of the series matters. The
+    number of frames is restored when the generator is exhausted or closed.
+
+    The frames are copied into a ring buffer of `buffer` slots such that the
+    memory is bounded. A yielded frame is overwritten `buffer` frames later
+    and should be copied by the caller if it needs to be kept longer.
+
+    :param conf: A configuration object.
+    :param buffer: An `int` of the number of slots in the ring buffer.
+    :param crop: The number of lines to remove at the top of the frames.
+
+    :returns: A generator of `(index, timestamp, frame)` where `timestamp` is
+              the end of the run of the frame and `frame` is a
+              `numpy.ndarray` of shape (stacks, height, width).
+    '''
+    num_frames = conf.parameters("ExpControl/scan/range/t/res")
+    set_numberframe(conf, 1)
+    try:
+        ring = None
+        for index in range(num_frames):
+            timing = {"configuration" : conf.name(), "frame" : index}
+            # The lock is not held while the frame is consumed
+            with current_session().lock:
+                _activate_and_run(conf, timing)
+                timestamp = time.time()
+                if ring is None:
+                    frame = get_stacks(conf, crop=crop, as_array=True, timing=timing)
+                    ring = numpy.empty((buffer,) + frame.shape, dtype=frame.dtype)
+                    ring[0] = frame
+                else:
+                    get_stacks(conf, crop=crop, out=ring[index % buffer], timing=timing)
+            registry.record("acquire_frames", **timing)
+            yield index, timestamp, ring[index % buffer][:, 0]
+    finally:
+        set_numberframe(conf, num_frames)
+
+def _save(savepath, writer, timing):
+    '''Save the measurement in line or take a snapshot of it for a writer.
+    Should be called with the lock of the session held.
+
+    :param savepath: A `str` of the saving path.
+    :param writer: A `MeasurementWriter` or `None`.
+    :param timing: A `dict` in which the duration (seconds) of the "save" phase
+                   is stored.
+
+    :returns: The path of the snapshot or `None` when saved in line.
+    '''
+    start = time.perf_counter()
+    snapshot = None
+    if writer is None:
+        get_measurement().save_as(savepath, True)
+    else:
+        snapshot = writer.snapshot(get_measurement())
+    timing["save"] = time.perf_counter() - start
+    return snapshot
+
+def _queue_save(snapshot, savepath, writer):
+    '''Queue the writing of a snapshot, without the lock of the session since
+    the queue may be full. Unless the writer has an application of its own,
+    the snapshot is compressed through the application of the session, i.e.
+    every call of the writer holds the lock of the session.
+
+    :returns: The `Future` of the save.
+    '''
+    application = writer.application if writer.application is not None else get_application()
+    return writer.enqueue(snapshot, savepath, True, application)
+
+def acquire_saveasmsr(conf,savepath, writer=None):
     '''Activate the given configuration and acquire an image stack.
 
     :param conf: A configuration object.
     :param savepath: a path to a file
+    :param writer: If defined, a `MeasurementWriter` to which the saving is
+                   queued instead of being done in line.
 
-    :return: An image stack (3d array) and the acquisition time (seconds).
+    :return: An image stack (3d array) and the acquisition time (seconds). When
+             a writer is given, the `Future` of the save is also returned.
     '''
-    measurement.activate(conf)
-    start = time.time()
-    im.run(measurement)
-    end = time.time()
-    stacks = [conf.stack(i) for i in range(conf.number_of_stacks())]
+    timing = {"configuration" : conf.name()}
+    with current_session().lock:
+        _activate_and_run(conf, timing)
+        x, y = get_offsets(conf)
+        print("Acquiring with configuration", conf.name(), "at offset x:", x, ", y:", y)
+        #conf.stack(conf.name())
+        stacks = get_stacks(conf, timing=timing)
+        snapshot = _save(savepath, writer, timing)
+    handle = None if writer is None else _queue_save(snapshot, savepath, writer)
+    registry.record("acquire_saveasmsr", **timing)
+    if writer is not None:
+        return stacks, timing["run"] - DEAD_TIME, handle
+    return stacks, timing["run"] - DEAD_TIME
+
+def acquire_async(conf, savepath=None, writer=None):
+    '''Queue the acquisition of the given configuration and return immediately.
+
+    Acquisitions are run one after the other on a dedicated thread of the
+    current session, in the order they were queued. asyncio users may await the returned future using
+    `asyncio.wrap_future`.
+
+    :param conf: A configuration object.
+    :param savepath: If defined, the measurement is saved to this path (see
+                     `acquire_saveasmsr`).
+    :param writer: A `MeasurementWriter` used to save the measurement.
+
+    :returns: A `concurrent.futures.Future` that resolves to the image stack and
+              the acquisition time (seconds), as returned by `acquire`.
+    '''
+    session = current_session()
+    executor = session.acquisition_executor()
+    if savepath is None:
+        return executor.submit(session.acquire, conf)
+    return executor.submit(session.acquire_saveasmsr, conf, savepath, writer)
+
+def acquire_pipeline(jobs, analyze, max_workers=1):
+    '''Acquire a sequence of regions while the analysis of the previous
+    regions runs on a pool of workers.
+
+    Each job is configured and acquired on the calling thread. The analysis
+    of a region is submitted to the pool as soon as its acquisition ends so
+    that the next region is configured and acquired in the meantime.
+
+    :param jobs: An iterable of `(conf, offsets, parameters)` where `offsets`
+                 is a `tuple` of (x, y) offsets or `None` and `parameters` is a
+                 `dict` of path-like keys and values or `None`.
+    :param analyze: A callable `analyze(stacks, job)` receiving the image stack
+                    returned by `acquire` and the job.
+    :param max_workers: The number of analyses that may run concurrently.
+
+    :returns: A generator of the analysis results in the order of the jobs.
+    '''
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis") as executor:
+        for job in jobs:
+            conf, offsets, parameters = job
+            with batch(conf) as transaction:
+                if offsets is not None:
+                    set_offsets(transaction, *offsets)
+                for key, value in (parameters or {}).items():
+                    transaction.set_parameters(key, value)
+            stacks, _ = acquire(conf)
+            pending.append(executor.submit(analyze, stacks, job))
+
+            # Yields the finished analyses and waits when too many are pending
+            while pending and (pending[0].done() or len(pending) > max_workers):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def acquire_jobs(jobs, constraints=(), order=None, switch_cost=1.0, move_cost=1e4):
+    '''Acquire a set of (offsets, configuration) jobs in the order that
+    minimizes the configuration switches and the moves between regions.
+
+    :param jobs: A `list` of `(offsets, conf)` where `offsets` is a `tuple` of
+                 (x, y) offsets.
+    :param constraints: A `list` of `(before, after)` job indices.
+    :param order: A sequence of configuration names in the order they need to
+                  be acquired on the same region, e.g. `["Confocal", "STED"]`.
+    :param switch_cost: The cost of switching configuration.
+    :param move_cost: The cost of moving by one meter.
+
+    :returns: A `list` of the results of `acquire` in the order of the jobs and
+              the `list` of job indices in the order they were acquired.
+    '''
+    regions = [tuple(offsets) for offsets, _ in jobs]
+    names = [conf.name() for _, conf in jobs]
+    constraints = list(constraints)
+    if order is not None:
+        constraints.extend(planning.region_constraints(regions, names, order))
+    start = get_offsets(jobs[0][1]) if jobs else None
+    schedule = planning.order_jobs(regions, names, constraints, switch_cost=switch_cost,
+                                   move_cost=move_cost, start=start)
+
+    results = [None] * len(jobs)
+    for index in schedule:
+        offsets, conf = jobs[index]
+        set_offsets(conf, *offsets)
+        results[index] = acquire(conf)
+    return results, schedule
+
+def tile_job(conf, area, overlap=0.1, savedir=".", resume=True, restore_stage=True):
+    '''Acquire a mosaic of tiles one tile at a time (see `tile_scan`). A tile
+    is acquired every time the generator is resumed, such that the scan can be
+    interleaved with other acquisitions, e.g. as a job of a
+    `jobs.JobScheduler`. The stage is moved to each tile before its acquisition
+    and moved back before each tile is yielded, such that the acquisitions
+    interleaved between two tiles are made where the stage was left.
+
+    :param conf: A configuration object.
+    :param area: A `tuple` of the (width, height) of the area (m).
+    :param overlap: The overlap between neighbouring tiles in [0, 1).
+    :param savedir: A `str` of the directory where the tiles are saved.
+    :param resume: A `bool` whether to skip the tiles that were already saved.
+    :param restore_stage: A `bool` whether to move the stage back between
+                          tiles. Otherwise, it is only moved back once the
+                          generator is exhausted or closed.
+
+    :returns: A generator of the `dict` of each acquired tile. Its return value
+              is the `list` of every tile, as returned by `tile_scan`.
+    '''
+    if not 0 <= overlap < 1:
+        raise ValueError("The overlap should be in [0, 1), got {}".format(overlap))
+    os.makedirs(savedir, exist_ok=True)
+    manifest = os.path.join(savedir, "tiles.jsonl")
+
+    tile = get_imagesize(conf)
+    pixelsize = get_pixelsize(conf)
+    # The step is rounded to an integer number of pixels to ease stitching
+    step = [max(1, round(size * (1 - overlap) / psz)) * psz for size, psz in zip(tile, pixelsize)]
+    x, y, z = get_coarse_range(conf)
+    tiles = planning.serpentine_grid(area, tile, step, center=(x, y))
+
+    records = {}
+    if resume and os.path.isfile(manifest):
+        with open(manifest, "r") as file:
+            for line in file:
+                record = json.loads(line)
+                records[(record["row"], record["col"])] = record
+
+    resolution = get_resolution(conf)
+    estimated = resolution[0] * resolution[1] * get_dwelltime(conf)
+
+    try:
+        for row, col, tile_x, tile_y in tiles:
+            if (row, col) in records:
+                record = records[(row, col)]
+                if not numpy.allclose((record["x"], record["y"]), (tile_x, tile_y)):
+                    raise ValueError("Tile ({}, {}) in {} was acquired at a different position. Use another savedir or resume=False.".format(row, col, manifest))
+                continue
+            start = time.perf_counter()
+            set_coarse_range(conf, tile_x, tile_y, z)
+            stacks, _ = acquire(conf, as_array=True)
+            actual = time.perf_counter() - start
+
+            path = os.path.join(savedir, "tile_{:03d}_{:03d}.npy".format(row, col))
+            numpy.save(path, stacks)
+            record = {
+                "row" : row, "col" : col, "x" : float(tile_x), "y" : float(tile_y), "z" : float(z),
+                "path" : path, "estimated" : float(estimated), "actual" : actual,
+            }
+            with open(manifest, "a") as file:
+                file.write(json.dumps(record) + "\n")
+            records[(row, col)] = record
+            print("Tile ({}, {}) of {}: estimated {:0.2f} s, actual {:0.2f} s".format(row, col, len(tiles), estimated, actual))
+            if restore_stage:
+                set_coarse_range(conf, x, y, z)
+            yield record
+    finally:
+        set_coarse_range(conf, x, y, z)
+    return [records[(row, col)] for row, col, _, _ in tiles if (row, col) in records]
+
+def tile_scan(conf, area, overlap=0.1, savedir=".", resume=True):
+    '''Acquire a mosaic of tiles covering an area centered on the current stage
+    position. The tiles are visited in a serpentine order and each tile is
+    saved to `savedir` as soon as it is acquired.
+
+    The stage coordinates and timings of the tiles are appended to
+    `tiles.jsonl` in `savedir`. When `resume` is `True`, the tiles already
+    listed in this file are skipped such that an interrupted scan can be
+    continued by calling the function again with the same arguments.
+
+    :param conf: A configuration object.
+    :param area: A `tuple` of the (width, height) of the area (m).
+    :param overlap: The overlap between neighbouring tiles in [0, 1).
+    :param savedir: A `str` of the directory where the tiles are saved.
+    :param resume: A `bool` whether to skip the tiles that were already saved.
+
+    :returns: A `list` of `dict` of the tiles with their stage coordinates,
+              saving path, estimated and actual acquisition time (seconds).
+    '''
+    # Nothing is acquired between the tiles, the stage goes straight to the next tile
+    job = tile_job(conf, area, overlap=overlap, savedir=savedir, resume=resume, restore_stage=False)
+    while True:
+        try:
+            next(job)
+        except StopIteration as stop:
+            return stop.value
+
+def order_regions(conf, regions, coarse=None):
+    '''Orders regions to minimize the travel of the scanner and the stage.
+
+    The regions are offsets as returned by `user.get_regions`. They are
+    converted to absolute positions using the coarse range and the path starts
+    at the current position of the configuration.
+
+    :param conf: A configuration object.
+    :param regions: A `list` of (x, y) offsets.
+    :param coarse: A `list` of (x, y) coarse positions, one per region. Defaults
+                   to the current coarse range of the configuration.
+
+    :returns: A `list` of indices of the regions in the order they should be
+              acquired and the estimated travel saved (m).
+    '''
+    coarse_x, coarse_y, _ = get_coarse_range(conf)
+    if coarse is None:
+        coarse = [(coarse_x, coarse_y)] * len(regions)
+    positions = [(cx + x, cy + y) for (x, y), (cx, cy) in zip(regions, coarse)]
     x, y = get_offsets(conf)
-    print("Acquiring with configuration", conf.name(), "at offset x:", x, ", y:", y)
-    measurement.save_as(savepath,True)
-    #conf.stack(conf.name())
-    # chop the first 2 lines because of imaging problems I guess
-    # chop 0.08 seconds because life
-    return [[image.copy() for image in stack.data()[0]] for stack in stacks],end - start - 0.08
+    return planning.order_regions(positions, start=(coarse_x + x, coarse_y + y))
+
+def plan_positions(conf, positions, field):
+    '''Plans the acquisition of absolute positions by grouping those that fit
+    in the field of the scanner under a single stage position.
+
+    :param conf: A configuration object.
+    :param positions: A `list` of (x, y) absolute positions, i.e. coarse range
+                      plus offsets (m).
+    :param field: A `tuple` of the (width, height) reachable with the scan
+                  offsets (m).
+
+    :returns: A `list` of steps (see `planning.plan_positions`).
+    '''
+    x, y, _ = get_coarse_range(conf)
+    return planning.plan_positions(positions, field, start=(x, y))
+
+def run_plan(conf, plan):
+    '''Executes a plan created by `plan_positions`. The stage is moved once
+    per group of positions and each position is acquired with the scan offsets.
+
+    :param conf: A configuration object.
+    :param plan: A `list` of steps.
+
+    :returns: A generator of `(index, stacks, elapsed)` in the order of the plan
+              where `index` is the index of the position.
+    '''
+    _, _, z = get_coarse_range(conf)
+    for step in plan:
+        if step["action"] == "coarse":
+            set_coarse_range(conf, *step["position"], z)
+        elif step["action"] == "offsets":
+            set_offsets(conf, *step["offsets"])
+            stacks, elapsed = acquire(conf)
+            yield step["index"], stacks, elapsed
+        else:
+            raise ValueError("Unknown action in plan: {}".format(step["action"]))
+
+def sweep(conf, grid, costs=None, analyze=None):
+    '''Acquire a configuration over a grid or a list of parameter values.
+
+    The points are ordered such that the expensive parameters change as
+    rarely as possible (see `planning.order_grid` and `planning.order_points`).
+    Only the parameters that change between consecutive points are written and
+    the initial parameters are restored at the end.
+
+    :param conf: A configuration object.
+    :param grid: A `dict` mapping path-like keys to the `list` of their values,
+                 which defines a N-D grid, or a `list` of `dict` of path-like keys
+                 and values.
+    :param costs: A `dict` of the cost of changing each parameter.
+    :param analyze: A callable `analyze(stacks)` applied to the stacks of every
+                    point, e.g. to keep a score instead of the images.
+
+    :returns: A `dict` with the names of the parameters ("axes"), their values
+              ("values"), the results of each point ("data") and the time of
+              each point in seconds ("timings"). For a grid, "data" and
+              "timings" are indexed by the grid indices, otherwise by the index
+              of the point.
+    '''
+    costs = costs or {}
+    if isinstance(grid, dict):
+        axes = list(grid)
+        initial = {key : conf.parameters(key) for key in axes}
+        values = [list(grid[key]) for key in axes]
+        shape = tuple(len(value) for value in values)
+        indices = planning.order_grid(shape, [costs.get(key, 1.) for key in axes])
+        points = {index : {key : values[axis][i] for axis, (key, i) in enumerate(zip(axes, index))} for index in indices}
+    else:
+        axes = sorted({key for point in grid for key in point})
+        initial = {key : conf.parameters(key) for key in axes}
+        # The keys a point omits keep their initial value, independently of
+        # the order of the points
+        grid = [{**initial, **point} for point in grid]
+        values = list(grid)
+        shape = (len(grid),)
+        indices = [(i,) for i in planning.order_points(grid, costs)]
+        points = {(i,) : point for i, point in enumerate(grid)}
+
+    current = dict(initial)
+    data, timings = None, numpy.full(shape, numpy.nan)
+    try:
+        for index in indices:
+            start = time.perf_counter()
+            for key, value in points[index].items():
+                if current[key] != value:
+                    conf.set_parameters(key, value)
+                    current[key] = value
+            stacks, _ = acquire(conf, as_array=True)
+            result = stacks if analyze is None else analyze(stacks)
+            timings[index] = time.perf_counter() - start
+
+            if data is None:
+                result_array = numpy.asarray(result)
+                if result_array.dtype == object:
+                    data = numpy.empty(shape, dtype=object)
+                else:
+                    data = numpy.empty(shape + result_array.shape, dtype=result_array.dtype)
+            data[index] = result
+    finally:
+        for key, value in initial.items():
+            if current[key] != value:
+                conf.set_parameters(key, value)
+    return {"axes" : axes, "values" : values, "data" : data, "timings" : timings}
+
+def _parabola_vertex(a, b, c, fa, fb, fc):
+    '''Returns the abscissa of the vertex of the parabola through 3 points or
+    `None` if they are aligned.
+    '''
+    p = (b - a) * (fb - fc)
+    q = (b - c) * (fb - fa)
+    denominator = p - q
+    if denominator == 0:
+        return None
+    return b - 0.5 * ((b - a) * p - (b - c) * q) / denominator
+
+def autofocus(conf, span=2e-6, steps=5, tolerance=50e-9, resolution=64,
+              method="parabolic", metric="brenner", max_scans=12):
+    '''Find the focus by moving `coarse_z` and maximizing the sharpness of a
+    fast, low resolution scan of the configuration.
+
+    A coarse sweep of `steps` positions over `span` around the current
+    position brackets the focus, which is then refined by successive parabolic
+    fits (`method="parabolic"`) or golden-section steps (`method="golden"`)
+    until the bracket is smaller than `tolerance`. Each position is scanned
+    once. The scan parameters are restored and `coarse_z` is left at the focus.
+
+    :param conf: A configuration object.
+    :param span: The range (m) of the coarse sweep.
+    :param steps: The number of positions of the coarse sweep.
+    :param tolerance: The precision (m) of the focus.
+    :param resolution: The number of pixels per line of the scans.
+    :param method: "parabolic" or "golden".
+    :param metric: The method of `utils.sharpness` or a callable returning the
+                   sharpness of the stacks.
+    :param max_scans: The maximal number of scans.
+
+    :returns: The `float` focus position (m) and a `dict` of the number of
+              "scans", the "elapsed" time (seconds) and the scanned
+              "positions" with their "scores".
+    '''
+    if method not in ("parabolic", "golden"):
+        raise ValueError("Unknown autofocus method {}".format(method))
+    start = time.perf_counter()
+    if not callable(metric):
+        metric = functools.partial(utils.sharpness, method=metric)
+    key = "ExpControl/scan/range/coarse_z/g_off"
+    keys = ("ExpControl/scan/range/x/psz", "ExpControl/scan/range/y/psz", "ExpControl/scan/range/t/res")
+    initial = {path : conf.parameters(path) for path in keys}
+    width, height = get_imagesize(conf)
+    z0 = conf.parameters(key)
+    focus = z0
+    scores = {}
+
+    def evaluate(z):
+        conf.set_parameters(key, float(z))
+        stacks, _ = acquire(conf, as_array=True)
+        scores[z] = metric(stacks[:, 0])
+        return scores[z]
+
+    try:
+        with batch(conf) as transaction:
+            psz = max(width, height) / resolution
+            set_pixelsize(transaction, psz, psz)
+            set_numberframe(transaction, 1)
+
+        positions = list(z0 + numpy.linspace(-span / 2, span / 2, steps))
+        values = [evaluate(z) for z in positions]
+        best = int(numpy.argmax(values))
+        b, fb = positions[best], values[best]
+        a, fa = positions[max(best - 1, 0)], values[max(best - 1, 0)]
+        c, fc = positions[min(best + 1, steps - 1)], values[min(best + 1, steps - 1)]
+
+        while len(scores) < max_scans and c - a > tolerance:
+            z = None
+            if method == "parabolic" and a < b < c:
+                z = _parabola_vertex(a, b, c, fa, fb, fc)
+                if z is not None and abs(z - b) < tolerance / 2:
+                    # A vertex this close to `b` hardly shrinks the bracket,
+                    # a minimal step is taken instead (Brent)
+                    right = z > b or (z == b and c - b > b - a)
+                    z = b + tolerance / 2 if right else b - tolerance / 2
+            if z is None or not a < z < c or z in scores:
+                # Golden-section step in the larger side of the bracket
+                z = b + GOLDEN * (c - b) if c - b > b - a else b - GOLDEN * (b - a)
+            fz = evaluate(z)
+            if fz > fb:
+                if z > b:
+                    a, fa = b, fb
+                else:
+                    c, fc = b, fb
+                b, fb = z, fz
+            elif z > b:
+                c, fc = z, fz
+            else:
+                a, fa = z, fz
+        focus = b
+    finally:
+        conf.set_parameters(key, float(focus))
+        apply(conf, initial)
+
+    report = {"scans" : len(scores), "elapsed" : time.perf_counter() - start,
+              "positions" : sorted(scores), "scores" : [scores[z] for z in sorted(scores)]}
+    registry.record("autofocus", elapsed=report["elapsed"], scans=report["scans"])
+    return focus, report
+
+class DriftTracker:
+    '''Compensates the lateral drift of the sample between the acquisitions of
+    a configuration.
+
+    Each frame is registered against the previous frame (or the first frame
+    when `rolling` is `False`) by phase correlation. The measured drift is
+    added to the offsets of the configuration before the next acquisition.
+    The window and the FFT of the reference are cached, such that an update
+    costs one FFT pair.
+
+    Usage::
+
+        tracker = DriftTracker(conf)
+        for _ in range(num_timepoints):
+            stacks, _ = acquire(conf, as_array=True)
+            tracker.update(stacks[0, 0])
+    '''
+    def __init__(self, conf, stack=0, rolling=True, window=True):
+        self.conf = conf
+        self.stack = stack
+        self.rolling = rolling
+        self.use_window = window
+        self.origin = get_offsets(conf)
+        self.drift = (0., 0.)
+        self._window = None
+        self._reference = None
+
+    def _fft(self, frame):
+        if self.use_window and (self._window is None or self._window.shape != frame.shape):
+            self._window = utils.hann_window(frame.shape)
+        return utils.windowed_fft(frame, self._window if self.use_window else None)
+
+    def reset(self):
+        '''Forget the reference frame and the measured drift. The current
+        offsets become the origin.
+        '''
+        self.origin = get_offsets(self.conf)
+        self.drift = (0., 0.)
+        self._reference = None
+
+    def update(self, frame=None):
+        '''Register a frame and move the offsets of the configuration to
+        follow the drift. The first frame only sets the reference.
+
+        :param frame: An image (2d array) acquired at the current offsets of
+                      the configuration. If `None`, the configuration is
+                      acquired and the first frame of `stack` is used.
+
+        :returns: A `tuple` of the (x, y) drift (m) since the origin.
+        '''
+        start = time.perf_counter()
+        if frame is None:
+            stacks, _ = acquire(self.conf, as_array=True)
+            frame = stacks[self.stack, 0]
+        frame = numpy.asarray(frame)
+        offsets = get_offsets(self.conf)
+        frame_fft = self._fft(frame)
+
+        if self._reference is None or self._reference[0].shape != frame_fft.shape:
+            self._reference = (frame_fft, offsets, self.drift)
+            return self.drift
+
+        reference_fft, reference_offsets, reference_drift = self._reference
+        dy, dx = utils.phase_shift(reference_fft, frame_fft, frame.shape)
+        psz_x, psz_y = get_pixelsize(self.conf)
+        # Displacement of the sample between the frames, the scanned field
+        # itself moved by the difference of the offsets
+        self.drift = (reference_drift[0] + dx * psz_x + offsets[0] - reference_offsets[0],
+                      reference_drift[1] + dy * psz_y + offsets[1] - reference_offsets[1])
+        if self.rolling:
+            self._reference = (frame_fft, offsets, self.drift)
+        set_offsets(self.conf, self.origin[0] + self.drift[0], self.origin[1] + self.drift[1])
+        registry.record("drift", register=time.perf_counter() - start)
+        return self.drift
+
+def _session_method(function):
+    '''Wraps a function of this module as a method that runs it in the session.
+    Generators are resumed in the session one item at a time and context
+    managers are entered and exited in the session.
+    '''
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def method(self, *args, **kwargs):
+            generator = function(*args, **kwargs)
+            try:
+                while True:
+                    with self:
+                        try:
+                            item = next(generator)
+                        except StopIteration as stop:
+                            return stop.value
+                    yield item
+            finally:
+                with self:
+                    generator.close()
+    elif inspect.isgeneratorfunction(getattr(function, "__wrapped__", None)):
+        # A `contextmanager` only runs its body once entered, the session is
+        # thus held for the whole `with` block
+        @functools.wraps(function)
+        @contextmanager
+        def method(self, *args, **kwargs):
+            with self:
+                with function(*args, **kwargs) as value:
+                    yield value
+    else:
+        @functools.wraps(function)
+        def method(self, *args, **kwargs):
+            with self:
+                return function(*args, **kwargs)
+    return method
+
+for _name, _function in list(globals().items()):
+    if (inspect.isfunction(_function) and _function.__module__ == __name__
+            and not _name.startswith("_") and not hasattr(Session, _name)
+            and _name != "current_session"):
+        setattr(Session, _name, _session_method(_function))
 
 if __name__ == "__main__":
     import pickle
@@ -0,0 +1,443 @@
+'''
+This module implements helpers that sit in front of a specpy `Configuration`
+to reduce the number of round trips to Imspector.
+'''
+
+import copy
+import hashlib
+import pickle
+
+from collections import OrderedDict
+
+def split_path(key):
+    '''Splits a path-like key into its components.
+
+    :param key: A path-like `str` with "/" separators.
+
+    :returns: A `list` of path components.
+    '''
+    return [item for item in key.split("/") if item]
+
+def is_parent(parent, key):
+    '''Verifies whether a path is equal to or contains another path.
+
+    :param parent: A path-like `str` with "/" separators.
+    :param key: A path-like `str` with "/" separators.
+
+    :returns: A `bool` whether `key` is equal to or below `parent`.
+    '''
+    return key == parent or key.startswith(parent + "/")
+
+def relative_path(parent, key):
+    '''Returns the part of `key` that is below `parent`.
+
+    :param parent: A path-like `str` with "/" separators.
+    :param key: A path-like `str` below `parent`.
+
+    :returns: A path-like `str` (empty when both paths are equal).
+    '''
+    return key[len(parent):].strip("/")
+
+def get_path(value, key):
+    '''Returns the element of a nested structure at a path-like key. Integer
+    components are used as indices in `list`.
+
+    :param value: A nested structure of `dict` and `list`.
+    :param key: A path-like `str` with "/" separators.
+
+    :returns: The element at the desired path.
+    '''
+    for item in split_path(key):
+        if isinstance(value, (list, tuple)):
+            item = int(item)
+        value = value[item]
+    return value
+
+def set_path(value, key, element):
+    '''Sets in place the element of a nested structure at a path-like key.
+
+    :param value: A nested structure of `dict` and `list`.
+    :param key: A non-empty path-like `str` with "/" separators.
+    :param element: The value to set.
+
+    :returns: The updated structure.
+    '''
+    items = split_path(key)
+    node = value
+    for item in items[:-1]:
+        if isinstance(node, list):
+            item = int(item)
+        node = node[item]
+    item = items[-1]
+    if isinstance(node, list):
+        item = int(item)
+    node[item] = element
+    return value
+
+class ConfigTransaction:
+    '''Gathers the parameter reads and writes of a configuration.
+
+    Reads are served from memory once a path was fetched or written, and the
+    writes are merged per written subtree. Nothing is sent to Imspector before
+    `commit` is called. The transaction can be passed to any function of
+    `microscope` expecting a configuration object to change its parameters.
+    '''
+    def __init__(self, conf):
+        self.conf = conf
+        self.reads = 0
+        self.writes = 0
+        self._read = {}
+        self._staged = {}
+
+    def _find(self, cache, key):
+        for path in cache:
+            if is_parent(path, key):
+                return path
+        return None
+
+    def parameters(self, key):
+        '''Fetch the parameters at the desired key, taking into account the
+        staged writes.
+
+        :param key: A path-like `str` with "/" separators.
+
+        :returns: A copy of the value at the desired key.
+        '''
+        for cache in (self._staged, self._read):
+            path = self._find(cache, key)
+            if path is not None:
+                return copy.deepcopy(get_path(cache[path], relative_path(path, key)))
+
+        value = self.conf.parameters(key)
+        self.reads += 1
+        value = copy.deepcopy(value)
+        for path, staged in self._staged.items():
+            if is_parent(key, path):
+                set_path(value, relative_path(key, path), copy.deepcopy(staged))
+        self._read[key] = value
+        return copy.deepcopy(value)
+
+    def set_parameters(self, key, value):
+        '''Stages the value at the desired key.
+
+        :param key: A path-like `str` with "/" separators.
+        :param value: The desired value.
+        '''
+        value = copy.deepcopy(value)
+
+        path = self._find(self._staged, key)
+        if path is not None and path != key:
+            set_path(self._staged[path], relative_path(path, key), value)
+        else:
+            for path in [path for path in self._staged if is_parent(key, path)]:
+                del self._staged[path]
+            self._staged[key] = value
+
+        for path in list(self._read):
+            if is_parent(key, path):
+                del self._read[path]
+            elif is_parent(path, key):
+                set_path(self._read[path], relative_path(path, key), copy.deepcopy(value))
+
+    def commit(self):
+        '''Writes the staged parameters using one `set_parameters` call per
+        written subtree.
+        '''
+        for key, value in self._staged.items():
+            self.conf.set_parameters(key, value)
+            self.writes += 1
+        self._staged.clear()
+        self._read.clear()
+
+    def rollback(self):
+        '''Discards the staged parameters.
+        '''
+        self._staged.clear()
+        self._read.clear()
+
+    def __getattr__(self, name):
+        if name == "conf":
+            raise AttributeError(name)
+        return getattr(self.conf, name)
+
+class CachedConfiguration:
+    '''Read-through cache in front of a configuration.
+
+    Repeated reads are served from memory and writes go straight to the
+    configuration. The cached paths containing a written path are updated in
+    place and the cached paths below it are dropped. Changes made
+    outside of the proxy (e.g. in the Imspector interface) are not seen until
+    `invalidate` is called.
+    '''
+    def __init__(self, conf, prefetch=()):
+        self.conf = conf
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._cache = {}
+        for key in prefetch:
+            self.prefetch(key)
+
+    def prefetch(self, key):
+        '''Fetch a whole subtree with a single call so that the reads below it
+        are served from memory.
+
+        :param key: A path-like `str` with "/" separators.
+        '''
+        for path in [path for path in self._cache if is_parent(key, path)]:
+            del self._cache[path]
+        self._cache[key] = copy.deepcopy(self.conf.parameters(key))
+        self.misses += 1
+
+    def parameters(self, key):
+        '''Fetch the parameters at the desired key.
+
+        :param key: A path-like `str` with "/" separators.
+
+        :returns: A copy of the value at the desired key.
+        '''
+        for path, value in self._cache.items():
+            if is_parent(path, key):
+                self.hits += 1
+                return copy.deepcopy(get_path(value, relative_path(path, key)))
+        self.misses += 1
+        value = copy.deepcopy(self.conf.parameters(key))
+        self._cache[key] = value
+        return copy.deepcopy(value)
+
+    def set_parameters(self, key, value):
+        '''Sets the parameter at the desired key. The cached paths containing
+        the key are updated and the cached paths below it are dropped.
+
+        :param key: A path-like `str` with "/" separators.
+        :param value: The desired value.
+        '''
+        result = self.conf.set_parameters(key, value)
+        for path in list(self._cache):
+            if is_parent(key, path):
+                del self._cache[path]
+                self.invalidations += 1
+            elif is_parent(path, key):
+                try:
+                    set_path(self._cache[path], relative_path(path, key), copy.deepcopy(value))
+                except (KeyError, IndexError, TypeError, ValueError):
+                    # The cached subtree does not have the key, e.g. a new
+                    # entry, and is fetched again on the next read
+                    del self._cache[path]
+                    self.invalidations += 1
+        return result
+
+    def invalidate(self, key=None):
+        '''Removes the cached paths overlapping a key.
+
+        :param key: A path-like `str` with "/" separators. All paths are
+                    removed if `None`.
+        '''
+        if key is None:
+            paths = list(self._cache)
+        else:
+            paths = [path for path in self._cache if is_parent(path, key) or is_parent(key, path)]
+        for path in paths:
+            del self._cache[path]
+        self.invalidations += len(paths)
+
+    def stats(self):
+        '''Returns the cache statistics.
+
+        :returns: A `dict` with the number of hits, misses, invalidations and
+                  cached paths.
+        '''
+        return {
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "invalidations" : self.invalidations,
+            "size" : len(self._cache)
+        }
+
+    def __getattr__(self, name):
+        if name == "conf":
+            raise AttributeError(name)
+        return getattr(self.conf, name)
+
+def _equal(a, b):
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    return a == b
+
+def diff_parameters(current, desired, key=""):
+    '''Computes the smallest set of paths to write to go from the current to the
+    desired parameters. Only the keys present in `desired` are compared. Lists
+    of `dict` are compared element-wise while other lists are written as a
+    whole.
+
+    :param current: A nested structure of the current parameters.
+    :param desired: A nested structure of the desired parameters.
+    :param key: A path-like `str` of the root of both structures.
+
+    :returns: A `list` of `(path, old, new)` of the changed paths.
+    '''
+    if isinstance(desired, dict) and isinstance(current, dict):
+        changes = []
+        for name, value in desired.items():
+            path = "/".join(item for item in (key, str(name)) if item)
+            if name in current:
+                changes.extend(diff_parameters(current[name], value, path))
+            else:
+                changes.append((path, None, value))
+        return changes
+    if (isinstance(desired, (list, tuple)) and isinstance(current, (list, tuple))
+            and len(desired) == len(current)
+            and any(isinstance(value, (dict, list, tuple)) for value in desired)):
+        changes = []
+        for i, (old, new) in enumerate(zip(current, desired)):
+            changes.extend(diff_parameters(old, new, "{}/{}".format(key, i)))
+        return changes
+    if isinstance(desired, (list, tuple)) and isinstance(current, (list, tuple)):
+        if len(desired) == len(current) and all(_equal(old, new) for old, new in zip(current, desired)):
+            return []
+        return [(key, current, desired)]
+    if _equal(current, desired):
+        return []
+    return [(key, current, desired)]
+
+def apply_parameters(conf, desired):
+    '''Writes the desired parameters in a configuration using the smallest
+    changed paths. The current value of every key of `desired` is read once and
+    nothing is written for the values that are already set.
+
+    :param conf: A configuration object.
+    :param desired: A `dict` of path-like keys and their desired value, e.g.
+                    `{"ExpControl/scan/range/x/off" : 0.0}` or
+                    `{"ExpControl" : {"scan" : {...}}}`.
+
+    :returns: A `dict` mapping the written paths to their `(old, new)` values.
+    '''
+    changes = {}
+    for key, value in desired.items():
+        current = conf.parameters(key)
+        for path, old, new in diff_parameters(current, value, key):
+            conf.set_parameters(path, new)
+            changes[path] = (old, new)
+    return changes
+
+class ConfigurationPool:
+    '''Reuses the cloned configurations of a measurement.
+
+    A clone is checked out with `checkout` and given back with `release`. Only
+    released clones are reused: a released clone of the same template and
+    parameters is preferred, and the parameters are re-applied by minimal diff
+    in case the clone was changed while it was checked out. When the pool is
+    full, the least recently released clone is re-parameterized from the
+    template instead of cloning again, which caps the number of configurations
+    in the measurement.
+
+    Usage::
+
+        pool = ConfigurationPool(microscope.clone)
+        clone = pool.checkout(conf, {"ExpControl/scan/range/x/psz" : 20e-9})
+        try:
+            microscope.acquire(clone)
+        finally:
+            pool.release(clone)
+    '''
+    def __init__(self, clone, maxsize=8, keys=("ExpControl",)):
+        '''Instantiates the `ConfigurationPool`.
+
+        :param clone: A callable `clone(conf)` returning a new clone, e.g.
+                      `microscope.clone`.
+        :param maxsize: The maximal number of clones.
+        :param keys: The path-like keys of the parameters copied from the
+                     template when a clone is re-parameterized.
+        '''
+        self.clone = clone
+        self.maxsize = maxsize
+        self.keys = keys
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Released clones in the order of their release, and checked out clones
+        self._free = OrderedDict()
+        self._used = {}
+
+    def _signature(self, template, parameters):
+        data = pickle.dumps((template.name(), sorted(parameters.items())), protocol=pickle.HIGHEST_PROTOCOL)
+        return hashlib.sha1(data).hexdigest()
+
+    def checkout(self, template, parameters=None):
+        '''Fetch a clone of the template with the given parameters. The clone
+        is not reused until it is released.
+
+        :param template: A configuration object.
+        :param parameters: A `dict` of path-like keys and values to apply to the
+                           clone.
+
+        :returns: A configuration object.
+        '''
+        parameters = parameters or {}
+        signature = self._signature(template, parameters)
+        match = next((key for key, (sig, _) in self._free.items() if sig == signature), None)
+        if match is not None:
+            self.hits += 1
+            _, conf = self._free.pop(match)
+            apply_parameters(conf, parameters)
+        elif len(self._free) + len(self._used) < self.maxsize:
+            self.misses += 1
+            conf = self.clone(template)
+            apply_parameters(conf, parameters)
+        elif self._free:
+            self.misses += 1
+            self.evictions += 1
+            _, (_, conf) = self._free.popitem(last=False)
+            self._reparameterize(conf, template, parameters)
+        else:
+            raise RuntimeError("All the {} clones of the pool are checked out".format(len(self._used)))
+        self._used[id(conf)] = (signature, conf)
+        return conf
+
+    def release(self, conf):
+        '''Gives a clone back to the pool.
+
+        :param conf: A configuration returned by `checkout`.
+        '''
+        entry = self._used.pop(id(conf), None)
+        if entry is None:
+            raise ValueError("The configuration is not checked out from this pool")
+        self._free[id(conf)] = entry
+
+    def _reparameterize(self, conf, template, parameters):
+        desired, extra = {}, {}
+        for key in self.keys:
+            desired[key] = copy.deepcopy(template.parameters(key))
+        for path, value in parameters.items():
+            root = next((key for key in self.keys if is_parent(key, path)), None)
+            if root is None:
+                extra[path] = value
+            elif root == path:
+                desired[root] = copy.deepcopy(value)
+            else:
+                set_path(desired[root], relative_path(root, path), copy.deepcopy(value))
+        apply_parameters(conf, desired)
+        apply_parameters(conf, extra)
+
+    def clear(self):
+        '''Forgets the released clones of the pool. The configurations remain
+        in the measurement.
+        '''
+        self._free.clear()
+
+    def __len__(self):
+        return len(self._free) + len(self._used)
+
+    def stats(self):
+        '''Returns the pool statistics.
+
+        :returns: A `dict` with the number of hits, misses, evictions, clones
+                  and checked out clones.
+        '''
+        return {
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "evictions" : self.evictions,
+            "size" : len(self),
+            "used" : len(self._used)
+        }
@@ -0,0 +1,297 @@
+'''
+This module implements the planning of the acquisitions, e.g. the order in
+which regions and configurations are visited. The functions only work on
+positions and configuration names and do not communicate with Imspector.
+'''
+
+import numpy
+
+def distance(a, b):
+    '''Computes the euclidean distance between two positions.
+
+    :param a: A `tuple` of coordinates (m).
+    :param b: A `tuple` of coordinates (m).
+
+    :returns: A `float` of the distance (m).
+    '''
+    return float(numpy.sqrt(sum((float(i) - float(j)) ** 2 for i, j in zip(a, b))))
+
+def region_constraints(regions, configurations, order):
+    '''Creates the ordering constraints of the configurations acquired on the
+    same region, e.g. confocal before STED.
+
+    :param regions: A `list` of regions (hashable positions).
+    :param configurations: A `list` of configuration names, one per job.
+    :param order: A sequence of configuration names in the order they need to
+                  be acquired on a region.
+
+    :returns: A `list` of `(before, after)` job indices.
+    '''
+    rank = {name : i for i, name in enumerate(order)}
+    constraints = []
+    for i, (region_i, conf_i) in enumerate(zip(regions, configurations)):
+        for j, (region_j, conf_j) in enumerate(zip(regions, configurations)):
+            if (i != j and tuple(region_i) == tuple(region_j) and conf_i in rank
+                    and conf_j in rank and rank[conf_i] < rank[conf_j]):
+                constraints.append((i, j))
+    return constraints
+
+def order_jobs(regions, configurations, constraints=(), switch_cost=1.0, move_cost=1e4, start=None):
+    '''Orders the (region, configuration) jobs to minimize the configuration
+    switches and the moves between regions.
+
+    The jobs are ordered greedily: among the jobs whose predecessors are done,
+    the one with the smallest cost from the current state is selected. Ties are
+    broken by the original order of the jobs.
+
+    :param regions: A `list` of regions, one per job, as `tuple` of coordinates (m).
+    :param configurations: A `list` of configuration names, one per job.
+    :param constraints: A `list` of `(before, after)` job indices.
+    :param switch_cost: The cost of switching configuration.
+    :param move_cost: The cost of moving by one meter.
+    :param start: A `tuple` of the starting position. Defaults to the first region.
+
+    :returns: A `list` of job indices in the order they should be acquired.
+    '''
+    num_jobs = len(regions)
+    if len(configurations) != num_jobs:
+        raise ValueError("Expected one configuration per region, got {} regions and {} configurations".format(num_jobs, len(configurations)))
+
+    predecessors = [set() for _ in range(num_jobs)]
+    for before, after in constraints:
+        predecessors[after].add(before)
+
+    position = regions[0] if (start is None and num_jobs) else start
+    configuration = None
+    done, order = set(), []
+    while len(order) < num_jobs:
+        available = [i for i in range(num_jobs) if i not in done and predecessors[i] <= done]
+        if not available:
+            raise ValueError("The ordering constraints contain a cycle.")
+        costs = [
+            switch_cost * (configuration is not None and configurations[i] != configuration)
+            + move_cost * distance(position, regions[i])
+            for i in available
+        ]
+        selected = available[int(numpy.argmin(costs))]
+        order.append(selected)
+        done.add(selected)
+        position, configuration = regions[selected], configurations[selected]
+    return order
+
+def count_switches(regions, configurations, order):
+    '''Counts the configuration switches and the travelled distance of an order.
+
+    :param regions: A `list` of regions, one per job.
+    :param configurations: A `list` of configuration names, one per job.
+    :param order: A `list` of job indices.
+
+    :returns: A `tuple` of the number of switches and the distance (m).
+    '''
+    switches, travel = 0, 0.
+    for previous, current in zip(order[:-1], order[1:]):
+        switches += configurations[previous] != configurations[current]
+        travel += distance(regions[previous], regions[current])
+    return switches, travel
+
+def serpentine_grid(area, tile, step, center=(0., 0.)):
+    '''Computes the tiles covering an area, visited row by row with alternating
+    directions such that consecutive tiles are always neighbours.
+
+    :param area: A `tuple` of the (width, height) of the area (m).
+    :param tile: A `tuple` of the (width, height) of a tile (m).
+    :param step: A `tuple` of the (x, y) distance between tile centers (m).
+    :param center: A `tuple` of the (x, y) center of the area (m).
+
+    :returns: A `list` of `(row, col, x, y)` where (x, y) is the tile center.
+    '''
+    num_cols, num_rows = [
+        max(1, int(numpy.ceil((size - tile_size) / step_size - 1e-9)) + 1)
+        for size, tile_size, step_size in zip(area, tile, step)
+    ]
+    x0 = center[0] - (num_cols - 1) * step[0] / 2
+    y0 = center[1] - (num_rows - 1) * step[1] / 2
+    tiles = []
+    for row in range(num_rows):
+        cols = range(num_cols) if row % 2 == 0 else reversed(range(num_cols))
+        for col in cols:
+            tiles.append((row, col, x0 + col * step[0], y0 + row * step[1]))
+    return tiles
+
+def path_length(positions, order, start=None):
+    '''Computes the length of the path visiting the positions in order.
+
+    :param positions: A `list` of `tuple` of coordinates (m).
+    :param order: A `list` of indices of positions.
+    :param start: A `tuple` of the starting position. If `None`, the path starts
+                  at the first visited position.
+
+    :returns: A `float` of the length of the path (m).
+    '''
+    points = [positions[i] for i in order]
+    if start is not None:
+        points = [start] + points
+    return sum(distance(a, b) for a, b in zip(points[:-1], points[1:]))
+
+def order_regions(positions, start=None, max_iterations=100):
+    '''Orders the positions to minimize the travel between them. An initial path
+    is built by visiting the nearest unvisited position and is improved by
+    2-opt moves, i.e. by reversing the segments of the path that shorten it.
+
+    :param positions: A `list` of `tuple` of coordinates (m).
+    :param start: A `tuple` of the starting position. If `None`, the path starts
+                  at the first position.
+    :param max_iterations: The maximal number of 2-opt passes.
+
+    :returns: A `list` of indices of positions in the order they should be
+              visited and the travel saved (m) compared to the original order.
+    '''
+    num_positions = len(positions)
+    if num_positions < 2:
+        return list(range(num_positions)), 0.
+    points = numpy.array(positions, dtype=float)
+    if start is None:
+        origin = points[0]
+    else:
+        origin = numpy.array(start, dtype=float)
+    points = numpy.concatenate((origin[None], points), axis=0)
+    distances = numpy.sqrt(((points[:, None] - points[None]) ** 2).sum(axis=-1))
+
+    # Nearest neighbour construction from the starting position (node 0)
+    path, remaining = [0], set(range(1, num_positions + 1))
+    while remaining:
+        candidates = sorted(remaining)
+        node = candidates[int(numpy.argmin(distances[path[-1], candidates]))]
+        path.append(node)
+        remaining.remove(node)
+
+    # 2-opt improvement of the open path, the starting node is kept in place
+    for _ in range(max_iterations):
+        improved = False
+        for i in range(1, num_positions):
+            for j in range(i + 1, num_positions + 1):
+                a, b = path[i - 1], path[i]
+                c = path[j]
+                d = path[j + 1] if j < num_positions else None
+                before = distances[a, b] + (distances[c, d] if d is not None else 0.)
+                after = distances[a, c] + (distances[b, d] if d is not None else 0.)
+                if after < before - 1e-15:
+                    path[i:j + 1] = path[i:j + 1][::-1]
+                    improved = True
+        if not improved:
+            break
+
+    order = [node - 1 for node in path[1:]]
+    original = path_length(positions, list(range(num_positions)), start=tuple(origin))
+    optimized = path_length(positions, order, start=tuple(origin))
+    return order, original - optimized
+
+def cluster_positions(positions, field):
+    '''Groups the positions into clusters that fit in the field of the scanner
+    such that every position of a cluster can be reached with the scan offsets
+    from a single stage position.
+
+    The clusters are grown greedily from the leftmost unassigned position by
+    adding the nearest positions as long as the bounding box of the cluster
+    fits in the field.
+
+    :param positions: A `list` of (x, y) positions (m).
+    :param field: A `tuple` of the (width, height) reachable with the scan
+                  offsets (m).
+
+    :returns: A `list` of `(center, members)` where `center` is the (x, y)
+              center of the bounding box of the cluster and `members` is a
+              `list` of indices of positions.
+    '''
+    points = numpy.array(positions, dtype=float).reshape(-1, 2)
+    unassigned = sorted(range(len(points)), key=lambda i: (points[i, 0], points[i, 1]))
+    clusters = []
+    while unassigned:
+        seed = unassigned[0]
+        candidates = sorted(unassigned, key=lambda i: distance(points[seed], points[i]))
+        members = []
+        low, high = points[seed].copy(), points[seed].copy()
+        for i in candidates:
+            new_low, new_high = numpy.minimum(low, points[i]), numpy.maximum(high, points[i])
+            if numpy.all(new_high - new_low <= numpy.asarray(field, dtype=float)):
+                members.append(i)
+                low, high = new_low, new_high
+        unassigned = [i for i in unassigned if i not in members]
+        clusters.append((tuple(((low + high) / 2).tolist()), members))
+    return clusters
+
+def plan_positions(positions, field, start=None):
+    '''Plans the acquisition of positions with as few stage moves as possible.
+    The positions are clustered (see `cluster_positions`) and the clusters, as
+    well as the positions within each cluster, are ordered to minimize the
+    travel (see `order_regions`).
+
+    :param positions: A `list` of (x, y) positions (m).
+    :param field: A `tuple` of the (width, height) reachable with the scan
+                  offsets (m).
+    :param start: A `tuple` of the (x, y) starting position of the stage.
+
+    :returns: A `list` of steps. Each step is a `dict` with either
+              `{"action" : "coarse", "position" : (x, y)}` to move the stage or
+              `{"action" : "offsets", "offsets" : (x, y), "index" : i}` to
+              acquire position `i` with the scan offsets relative to the stage.
+    '''
+    clusters = cluster_positions(positions, field)
+    centers = [center for center, _ in clusters]
+    cluster_order, _ = order_regions(centers, start=start)
+
+    plan = []
+    for c in cluster_order:
+        center, members = clusters[c]
+        plan.append({"action" : "coarse", "position" : center})
+        member_order, _ = order_regions([positions[i] for i in members], start=center)
+        for m in member_order:
+            index = members[m]
+            x, y = positions[index][0], positions[index][1]
+            plan.append({"action" : "offsets", "offsets" : (x - center[0], y - center[1]), "index" : index})
+    return plan
+
+def order_grid(shape, costs=None):
+    '''Orders the points of a N-D grid such that consecutive points differ by a
+    single step along one axis. The most expensive axes change the least often.
+
+    :param shape: A `tuple` of the number of values along each axis.
+    :param costs: A `list` of the cost of changing the value of each axis.
+
+    :returns: A `list` of `tuple` of indices in the grid.
+    '''
+    if costs is None:
+        costs = [1.] * len(shape)
+    # Stable sort such that the first axes are the slowest for equal costs
+    axes = sorted(range(len(shape)), key=lambda axis: -costs[axis])
+    order = [()]
+    for axis in axes:
+        points = []
+        for i, point in enumerate(order):
+            values = range(shape[axis]) if i % 2 == 0 else reversed(range(shape[axis]))
+            points.extend(point + (value,) for value in values)
+        order = points
+    inverse = [axes.index(axis) for axis in range(len(shape))]
+    return [tuple(point[i] for i in inverse) for point in order]
+
+def order_points(points, costs=None):
+    '''Orders a list of parameter points to minimize the cost of the changes
+    between consecutive points. The points are visited greedily by selecting
+    the cheapest change from the current point.
+
+    :param points: A `list` of `dict` of parameter values.
+    :param costs: A `dict` of the cost of changing the value of each parameter.
+                  Parameters not in `costs` have a cost of 1.
+
+    :returns: A `list` of indices of points.
+    '''
+    if not points:
+        return []
+    costs = costs or {}
+    def cost(a, b):
+        return sum(costs.get(key, 1.) for key in set(a) | set(b) if a.get(key) != b.get(key))
+    order, remaining = [0], list(range(1, len(points)))
+    while remaining:
+        changes = [cost(points[order[-1]], points[i]) for i in remaining]
+        order.append(remaining.pop(int(numpy.argmin(changes))))
+    return order
@@ -0,0 +1,193 @@
+'''
+This module implements RESCue profiles, i.e. the full set of RESCue parameters
+of a channel that can be validated, compared and applied at once.
+'''
+
+# Fields stored in ExpControl/measurement/channels/<id>/rescue
+MEASUREMENT_FIELDS = (
+    "signal_level", "strength", "rescue_mode", "LTh_auto", "LTh_num_times",
+    "LTh_thresholds", "LTh_times", "UTh_auto", "UTh_threshold",
+)
+# Fields stored in ExpControl/rescue/channels/<id>
+RESCUE_FIELDS = (
+    "on", "rescue_allowed", "set_thresholds_manually", "UTh_manual", "UTh_use",
+    "auto_blank", "blanking", "use_as_probe",
+)
+NUM_THRESHOLDS = 4
+NUM_LASERS = 8
+
+def _pad(values, name):
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    if len(values) > NUM_THRESHOLDS:
+        raise ValueError("At most {} values are allowed for {}, got {}".format(NUM_THRESHOLDS, name, len(values)))
+    return list(values) + [0] * (NUM_THRESHOLDS - len(values))
+
+class RescueProfile:
+    '''Implements an immutable set of RESCue parameters of a channel.
+
+    Only the fields that are given are applied, the others are left as they
+    are in the configuration.
+
+    Usage::
+
+        profile = RescueProfile(on=True, signal_level=20.0, strength=5.0,
+                                LTh_thresholds=[10, 5], UTh_threshold=30)
+        profile.apply(conf, channel_id=0)
+    '''
+    __slots__ = ("_values",)
+
+    def __init__(self, **values):
+        unknown = set(values) - set(MEASUREMENT_FIELDS) - set(RESCUE_FIELDS)
+        if unknown:
+            raise ValueError("Unknown RESCue fields: {}".format(", ".join(sorted(unknown))))
+        values = {key : value for key, value in values.items() if value is not None}
+
+        for key in ("signal_level", "strength"):
+            if key in values:
+                values[key] = float(values[key])
+                if values[key] < 0:
+                    raise ValueError("{} should be positive, got {}".format(key, values[key]))
+        for key in ("rescue_mode", "LTh_num_times", "UTh_threshold"):
+            if key in values:
+                values[key] = int(values[key])
+                if values[key] < 0:
+                    raise ValueError("{} should be positive, got {}".format(key, values[key]))
+        if "LTh_num_times" in values and values["LTh_num_times"] > NUM_THRESHOLDS:
+            raise ValueError("LTh_num_times should be at most {}, got {}".format(NUM_THRESHOLDS, values["LTh_num_times"]))
+        if "LTh_thresholds" in values:
+            values["LTh_thresholds"] = list(map(int, _pad(values["LTh_thresholds"], "LTh_thresholds")))
+        if "LTh_times" in values:
+            values["LTh_times"] = _pad(values["LTh_times"], "LTh_times")
+        if "blanking" in values:
+            values["blanking"] = self._blanking(values["blanking"])
+        for key in ("on", "rescue_allowed", "set_thresholds_manually", "UTh_manual",
+                    "UTh_use", "auto_blank", "use_as_probe", "LTh_auto", "UTh_auto"):
+            if key in values:
+                values[key] = bool(values[key])
+        object.__setattr__(self, "_values", values)
+
+    @staticmethod
+    def _blanking(lasers):
+        '''Converts the blanked lasers to the `list` of `bool` used by Imspector.
+        '''
+        lasers = list(lasers)
+        if len(lasers) == NUM_LASERS and all(isinstance(laser, bool) for laser in lasers):
+            return lasers
+        blanking = [False] * NUM_LASERS
+        for laser in lasers:
+            if not 0 <= int(laser) < NUM_LASERS:
+                raise ValueError("Laser IDs should be in [0, {}), got {}".format(NUM_LASERS, laser))
+            blanking[int(laser)] = True
+        return blanking
+
+    @classmethod
+    def from_configuration(cls, conf, channel_id):
+        '''Reads the RESCue profile of a channel.
+
+        :param conf: A configuration object.
+        :param channel_id: ID of the channel (Starting from 0)
+
+        :returns: A `RescueProfile`.
+        '''
+        measurement = conf.parameters(f"ExpControl/measurement/channels/{channel_id}/rescue")
+        rescue = conf.parameters(f"ExpControl/rescue/channels/{channel_id}")
+        values = {key : measurement[key] for key in MEASUREMENT_FIELDS if key in measurement}
+        values.update({key : rescue[key] for key in RESCUE_FIELDS if key in rescue})
+        return cls(**values)
+
+    def __getattr__(self, name):
+        if name in MEASUREMENT_FIELDS or name in RESCUE_FIELDS:
+            return self._values.get(name)
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RescueProfile is immutable, use replace")
+
+    def __eq__(self, other):
+        return isinstance(other, RescueProfile) and self._values == other._values
+
+    def __hash__(self):
+        return hash(tuple(sorted((key, tuple(value) if isinstance(value, list) else value)
+                                 for key, value in self._values.items())))
+
+    def __repr__(self):
+        return "RescueProfile({})".format(", ".join("{}={!r}".format(key, value) for key, value in self._values.items()))
+
+    def to_dict(self):
+        '''Returns the fields of the profile.
+
+        :returns: A `dict` of the defined fields.
+        '''
+        return dict(self._values)
+
+    def replace(self, **values):
+        '''Creates a new profile with some fields replaced.
+
+        :param values: The fields to replace.
+
+        :returns: A `RescueProfile`.
+        '''
+        new = self.to_dict()
+        new.update(values)
+        return RescueProfile(**new)
+
+    def diff(self, other):
+        '''Compares two profiles.
+
+        :param other: A `RescueProfile`.
+
+        :returns: A `dict` mapping the fields that differ to their values in
+                  `(self, other)`.
+        '''
+        keys = set(self._values) | set(other._values)
+        return {key : (self._values.get(key), other._values.get(key))
+                for key in keys if self._values.get(key) != other._values.get(key)}
+
+    def apply(self, conf, channel_id, previous=None):
+        '''Applies the profile to a channel with at most one write per RESCue
+        subtree. Subtrees that already hold the profile values are not written.
+
+        :param conf: A configuration object.
+        :param channel_id: ID of the channel (Starting from 0)
+        :param previous: The `RescueProfile` known to be applied to the channel.
+                         If it is equal to this profile, nothing is done.
+
+        :returns: A `dict` mapping the changed fields to their `(old, new)` values.
+        '''
+        if previous is not None and previous == self:
+            return {}
+        changes = {}
+        for path, fields in ((f"ExpControl/measurement/channels/{channel_id}/rescue", MEASUREMENT_FIELDS),
+                             (f"ExpControl/rescue/channels/{channel_id}", RESCUE_FIELDS)):
+            values = {key : self._values[key] for key in fields if key in self._values}
+            if not values:
+                continue
+            current = conf.parameters(path)
+            changed = {key : (current.get(key), value) for key, value in values.items() if current.get(key) != value}
+            if changed:
+                current.update(values)
+                conf.set_parameters(path, current)
+                changes.update(changed)
+        return changes
+
+profiles = {}
+
+def register(name, profile):
+    '''Stores a named profile.
+
+    :param name: A `str` of the name of the profile.
+    :param profile: A `RescueProfile`.
+    '''
+    if not isinstance(profile, RescueProfile):
+        raise TypeError("Expected a RescueProfile, got {}".format(type(profile).__name__))
+    profiles[name] = profile
+
+def get_profile(name):
+    '''Fetch a named profile.
+
+    :param name: A `str` of the name of the profile.
+
+    :returns: A `RescueProfile`.
+    '''
+    return profiles[name]
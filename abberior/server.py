@@ -0,0 +1,342 @@
+'''
+This module implements an acquisition server so that clients on other machines
+can drive the microscope, and the corresponding client.
+
+The server runs on the computer of Imspector, or against the debug `Imspector`
+for testing, and listens on TCP or on a Unix socket::
+
+    python -m abberior.server --host 0.0.0.0 --port 5555
+
+Every message is a 4-byte little-endian length, a JSON header and the raw
+bytes of the arrays described in the "arrays" field of the header. Jobs from
+all the clients are queued and executed one at a time.
+'''
+
+import argparse
+import asyncio
+import json
+import socket
+import struct
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+from . import microscope
+
+_HEADER = struct.Struct("<I")
+
+def encode(header, arrays=()):
+    '''Encodes a message.
+
+    :param header: A JSON serializable `dict`.
+    :param arrays: A sequence of `numpy.ndarray`.
+
+    :returns: The `bytes` of the message.
+    '''
+    arrays = [numpy.ascontiguousarray(array) for array in arrays]
+    header = dict(header, arrays=[{"dtype" : array.dtype.str, "shape" : array.shape} for array in arrays])
+    data = json.dumps(header).encode("utf-8")
+    return b"".join([_HEADER.pack(len(data)), data] + [array.tobytes() for array in arrays])
+
+def _decode_arrays(header, payload):
+    arrays, offset = [], 0
+    for description in header.get("arrays", []):
+        dtype = numpy.dtype(description["dtype"])
+        count = int(numpy.prod(description["shape"]))
+        array = numpy.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        arrays.append(array.reshape(description["shape"]))
+        offset += count * dtype.itemsize
+    return arrays
+
+def _payload_size(header):
+    return sum(int(numpy.prod(description["shape"])) * numpy.dtype(description["dtype"]).itemsize
+               for description in header.get("arrays", []))
+
+async def read_message(reader):
+    '''Reads a message from an asyncio stream.
+
+    :param reader: An `asyncio.StreamReader`.
+
+    :returns: The header `dict` and the `list` of arrays.
+    '''
+    size, = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    header = json.loads(await reader.readexactly(size))
+    payload = await reader.readexactly(_payload_size(header))
+    return header, _decode_arrays(header, payload)
+
+def _jsonable(value):
+    if isinstance(value, numpy.generic):
+        return value.item()
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
+
+class AcquisitionServer:
+    '''Serves the acquisitions of the microscope over asyncio streams.
+
+    Supported commands are "acquire", "set_parameters", "parameters" and
+    "stream_frames". Each request may give the name of the "configuration" to
+    use, otherwise the active configuration is used.
+    '''
+    def __init__(self, host="127.0.0.1", port=5555, path=None):
+        self.host = host
+        self.port = port
+        self.path = path
+        # Hardware calls of all the clients are executed one at a time
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="acquisition-server")
+        self.server = None
+
+    async def start(self):
+        '''Starts listening.
+        '''
+        if self.path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, path=self.path)
+        else:
+            self.server = await asyncio.start_server(self.handle, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        '''Starts listening and serves until cancelled.
+        '''
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        '''Stops listening and waits for the queued jobs.
+        '''
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+    def _configuration(self, name):
+        if name is None:
+            return microscope.measurement.active_configuration()
+        return microscope.measurement.configuration(name)
+
+    async def _run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    async def handle(self, reader, writer):
+        '''Handles the requests of a client until it disconnects.
+        '''
+        try:
+            while True:
+                try:
+                    header, arrays = await read_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                try:
+                    await self.dispatch(header, arrays, writer)
+                except ConnectionError:
+                    break
+                except Exception as err:
+                    writer.write(encode({"id" : header.get("id"), "status" : "error",
+                                         "error" : "{}: {}".format(type(err).__name__, err)}))
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    break
+        finally:
+            writer.close()
+
+    async def dispatch(self, header, arrays, writer):
+        '''Executes a request and writes its response.
+        '''
+        command, name = header.get("command"), header.get("configuration")
+        response = {"id" : header.get("id"), "status" : "ok"}
+        if command == "acquire":
+            def job():
+                conf = self._configuration(name)
+                return microscope.acquire(conf, as_array=True)
+            stacks, elapsed = await self._run(job)
+            response["result"] = {"elapsed" : elapsed}
+            writer.write(encode(response, [stacks]))
+        elif command == "set_parameters":
+            value = arrays[0] if arrays else header["value"]
+            await self._run(lambda : self._configuration(name).set_parameters(header["key"], value))
+            writer.write(encode(response))
+        elif command == "parameters":
+            value = await self._run(lambda : self._configuration(name).parameters(header["key"]))
+            response["result"] = json.loads(json.dumps(value, default=_jsonable))
+            writer.write(encode(response))
+        elif command == "stream_frames":
+            await self._stream_frames(header, name, writer)
+        else:
+            raise ValueError("Unknown command {}".format(command))
+
+    async def _stream_frames(self, header, name, writer):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        # Bounds the frames waiting to be sent, released once a frame is sent
+        slots = threading.Semaphore(header.get("buffer", 4))
+        cancelled = threading.Event()
+
+        def job():
+            conf = self._configuration(name)
+            frames = microscope.acquire_frames(conf)
+            count = 0
+            try:
+                for index, timestamp, frame in frames:
+                    message = encode({"id" : header.get("id"), "status" : "frame",
+                                      "index" : index, "timestamp" : timestamp}, [frame])
+                    # Waits for a slot without blocking the worker for good
+                    # when the client is gone
+                    while not slots.acquire(timeout=0.1):
+                        if cancelled.is_set():
+                            return count
+                    if cancelled.is_set():
+                        return count
+                    loop.call_soon_threadsafe(queue.put_nowait, message)
+                    count += 1
+            finally:
+                # Restores the number of frames of the configuration
+                frames.close()
+            return count
+
+        future = loop.run_in_executor(self.executor, job)
+        getter = None
+        try:
+            while not (future.done() and queue.empty()):
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter, future}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    writer.write(getter.result())
+                    slots.release()
+                    await writer.drain()
+                else:
+                    getter.cancel()
+        except BaseException:
+            if getter is not None:
+                getter.cancel()
+            cancelled.set()
+            await asyncio.gather(future, return_exceptions=True)
+            raise
+        count = await future
+        writer.write(encode({"id" : header.get("id"), "status" : "ok", "result" : {"frames" : count}}))
+
+class AcquisitionClient:
+    '''Implements a blocking client of the `AcquisitionServer`.
+    '''
+    def __init__(self, host="127.0.0.1", port=5555, path=None, timeout=None):
+        if path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port), timeout=timeout)
+        self._id = 0
+
+    def _receive_exactly(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("The server closed the connection.")
+            data.extend(chunk)
+        return bytes(data)
+
+    def _receive(self):
+        size, = _HEADER.unpack(self._receive_exactly(_HEADER.size))
+        header = json.loads(self._receive_exactly(size))
+        arrays = _decode_arrays(header, self._receive_exactly(_payload_size(header)))
+        if header["status"] == "error":
+            raise RuntimeError(header["error"])
+        return header, arrays
+
+    def _request(self, header, arrays=()):
+        self._id += 1
+        self.socket.sendall(encode(dict(header, id=self._id), arrays))
+
+    def acquire(self, configuration=None):
+        '''Acquires a configuration.
+
+        :param configuration: A `str` of the name of the configuration.
+
+        :returns: A `numpy.ndarray` of shape (stacks, frames, height, width)
+                  and the acquisition time (seconds).
+        '''
+        self._request({"command" : "acquire", "configuration" : configuration})
+        header, arrays = self._receive()
+        return arrays[0], header["result"]["elapsed"]
+
+    def set_parameters(self, key, value, configuration=None):
+        '''Sets a parameter of a configuration.
+
+        :param key: A path-like `str` with "/" separators.
+        :param value: A JSON serializable value or a `numpy.ndarray`.
+        :param configuration: A `str` of the name of the configuration.
+        '''
+        if isinstance(value, numpy.ndarray):
+            self._request({"command" : "set_parameters", "key" : key, "configuration" : configuration}, [value])
+        else:
+            self._request({"command" : "set_parameters", "key" : key, "value" : value, "configuration" : configuration})
+        self._receive()
+
+    def parameters(self, key, configuration=None):
+        '''Fetch the parameters of a configuration.
+
+        :param key: A path-like `str` with "/" separators.
+        :param configuration: A `str` of the name of the configuration.
+
+        :returns: The value at the desired key.
+        '''
+        self._request({"command" : "parameters", "key" : key, "configuration" : configuration})
+        header, _ = self._receive()
+        return header["result"]
+
+    def stream_frames(self, configuration=None, buffer=4):
+        '''Streams the frames of a xyt configuration, acquired one at a time on
+        the server (see `microscope.acquire_frames`).
+
+        :param configuration: A `str` of the name of the configuration.
+        :param buffer: The number of frames buffered by the server.
+
+        :returns: A generator of `(index, timestamp, frame)`. When the
+                  generator is closed early, the remaining frames are read
+                  and dropped to keep the connection in sync.
+        '''
+        self._request({"command" : "stream_frames", "configuration" : configuration, "buffer" : buffer})
+        try:
+            while True:
+                header, arrays = self._receive()
+                if header["status"] != "frame":
+                    break
+                yield header["index"], header["timestamp"], arrays[0]
+        except GeneratorExit:
+            # Reads the remaining frames such that the next reply is in sync
+            while self._receive()[0]["status"] == "frame":
+                pass
+            raise
+
+    def close(self):
+        '''Closes the connection.
+        '''
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serves the acquisitions of the microscope")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--path", type=str, default=None,
+                        help="Path of a Unix socket, used instead of TCP")
+    args = parser.parse_args()
+
+    server = AcquisitionServer(host=args.host, port=args.port, path=args.path)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,98 @@
+'''
+This module implements a content-addressed store of configuration snapshots.
+'''
+
+import hashlib
+import pickle
+import threading
+import zlib
+
+class SnapshotStore:
+    '''Stores snapshots of parameters in a compact, deduplicated form.
+
+    A snapshot is split into the children of its root (e.g. `measurement`,
+    `scan`, ... for `ExpControl`). Each child is pickled, compressed and
+    stored once under the hash of its content, such that identical snapshots,
+    or snapshots sharing most of their subtrees, take almost no space.
+    '''
+    def __init__(self):
+        self.chunks = {}
+        self.manifests = {}
+        self._lock = threading.Lock()
+
+    def _put_chunk(self, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            if digest not in self.chunks:
+                self.chunks[digest] = zlib.compress(data)
+        return digest
+
+    def put(self, key, value):
+        '''Stores a snapshot.
+
+        :param key: A path-like `str` of the root of the snapshot.
+        :param value: The parameters at `key`.
+
+        :returns: A `str` of the identifier of the snapshot.
+        '''
+        if isinstance(value, dict):
+            children = tuple((name, self._put_chunk(child)) for name, child in value.items())
+            manifest = (key, True, children)
+        else:
+            manifest = (key, False, self._put_chunk(value))
+        data = pickle.dumps(manifest, protocol=pickle.HIGHEST_PROTOCOL)
+        snapshot = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            self.manifests.setdefault(snapshot, manifest)
+        return snapshot
+
+    def get(self, snapshot):
+        '''Fetch a snapshot.
+
+        :param snapshot: A `str` of the identifier of the snapshot.
+
+        :returns: A `tuple` of the path-like key and the parameters.
+        '''
+        key, is_dict, content = self.manifests[snapshot]
+        if is_dict:
+            return key, {name : self._get_chunk(digest) for name, digest in content}
+        return key, self._get_chunk(content)
+
+    def _get_chunk(self, digest):
+        return pickle.loads(zlib.decompress(self.chunks[digest]))
+
+    def __contains__(self, snapshot):
+        return snapshot in self.manifests
+
+    def __len__(self):
+        return len(self.manifests)
+
+    def nbytes(self):
+        '''Returns the size of the stored chunks.
+
+        :returns: An `int` of the number of bytes.
+        '''
+        return sum(len(chunk) for chunk in self.chunks.values())
+
+    def save(self, path):
+        '''Saves the store to a file.
+
+        :param path: A `str` of the path of the file.
+        '''
+        with self._lock, open(path, "wb") as file:
+            pickle.dump({"chunks" : self.chunks, "manifests" : self.manifests}, file,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path):
+        '''Loads the snapshots of a file in the store.
+
+        :param path: A `str` of the path of the file.
+        '''
+        with open(path, "rb") as file:
+            data = pickle.load(file)
+        with self._lock:
+            self.chunks.update(data["chunks"])
+            self.manifests.update(data["manifests"])
+
+store = SnapshotStore()
@@ -0,0 +1,127 @@
+'''
+This module implements an index of the stacks of a configuration to look them
+up by name without scanning every stack name.
+'''
+
+import bisect
+import re
+
+class StackIndex:
+    '''Maps the names of the stacks of a configuration to their positions.
+
+    The index is built once and rebuilt when the number of stacks of the
+    configuration changes. Renaming a stack does not change that number, in
+    which case `refresh(force=True)` should be called.
+
+    Usage::
+
+        index = StackIndex(conf)
+        name = index.find("640")
+        images = index.data(index.regex(r"Overview \\d+"))
+    '''
+    def __init__(self, conf):
+        self.conf = conf
+        self.count = None
+        self.positions = {}
+        self.names = []
+        self._sorted = []
+
+    def refresh(self, force=False):
+        '''Rebuild the index if the number of stacks changed.
+
+        :param force: If `True`, the index is rebuilt in any case.
+
+        :returns: A `bool` whether the index was rebuilt.
+        '''
+        count = self.conf.number_of_stacks()
+        if not force and count == self.count:
+            return False
+        self.names = list(self.conf.stack_names())
+        self.positions = {}
+        for position, name in enumerate(self.names):
+            # The first stack wins when several stacks share a name
+            self.positions.setdefault(name, position)
+        self._sorted = sorted(self.positions)
+        self.count = count
+        return True
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def exact(self, name):
+        '''Fetch the position of a stack.
+
+        :param name: A `str` of the name of the stack.
+
+        :returns: An `int` of the position or `None`.
+        '''
+        return self.positions.get(name)
+
+    def prefix(self, prefix):
+        '''Fetch the names of the stacks starting with a prefix.
+
+        :param prefix: A `str` of the prefix.
+
+        :returns: A `list` of names in the order of the stacks.
+        '''
+        start = bisect.bisect_left(self._sorted, prefix)
+        names = []
+        for name in self._sorted[start:]:
+            if not name.startswith(prefix):
+                break
+            names.append(name)
+        return sorted(names, key=self.positions.get)
+
+    def regex(self, pattern):
+        '''Fetch the names of the stacks matching a regular expression.
+
+        :param pattern: A `str` or compiled pattern, matched with `re.search`.
+
+        :returns: A `list` of names in the order of the stacks.
+        '''
+        pattern = re.compile(pattern)
+        # The positions are inserted in the order of the stacks
+        return [name for name in self.positions if pattern.search(name)]
+
+    def find(self, name):
+        '''Fetch the name of the stack best matching a name, trying an exact
+        match, then a prefix match and then a substring match. Among several
+        matches, the first stack is returned.
+
+        :param name: A `str` of the name to look for.
+
+        :returns: A `str` of the name of the stack or `None`.
+        '''
+        if name in self.positions:
+            return name
+        names = self.prefix(name)
+        if names:
+            return names[0]
+        for stack_name in self.positions:
+            if name in stack_name:
+                return stack_name
+        return None
+
+    def data(self, names, frame=0):
+        '''Fetch the data of several stacks.
+
+        :param names: An iterable of `str` of the names of the stacks.
+        :param frame: The `int` of the frame to keep, or `None` for every
+                      frame.
+
+        :returns: A `list` of the data of the stacks in the order of `names`.
+        '''
+        positions = []
+        for name in names:
+            position = self.positions.get(name)
+            if position is None:
+                raise KeyError("No stack named {!r} in configuration {}".format(name, self.conf.name()))
+            positions.append(position)
+        data = []
+        for position in positions:
+            frames = self.conf.stack(position).data()[0]
+            data.append(frames if frame is None else frames[frame])
+        return data
@@ -345,6 +345,7 @@ def get_regions(overview, config_overview, n=1, label=None, rectangles=None, act
         #img = microscope.get_overview(config)
         img = microscope.get_overview(config_overview, name = overview)
         points = get_points(img, n, " subregions within the overview {}".format(label), rectangles=rectangles)
+    config = microscope.cached(config)
     regions = utils.points2regions(points, microscope.get_pixelsize(config), microscope.get_resolution(config))
     x_offset, y_offset = microscope.get_offsets(config)
     regions_offset = [(x + x_offset, y + y_offset) for (x, y) in regions]
@@ -361,6 +362,7 @@ def get_rect_regions(n=1,overview=None,config_overview=None):
         config = config_overview
         img = microscope.get_overview(config_overview, name=overview)
     rectangles = get_rectangles(img, n, " subregions within the overview") # Select rectangles
+    config = microscope.cached(config)
     regions = utils.rect2regions(rectangles, microscope.get_pixelsize(config)) # New window size
     # points = utils.get_rect_center(rectangles, microscope.get_pixelsize(config))
     points = utils.get_rect_center(rectangles, microscope.get_pixelsize(config), microscope.get_resolution(config))
@@ -380,6 +382,7 @@ def move_rect_regions(n=1,overview=None,config_overview=None, rectangles=None, p
 
     rectangles = move_rectangles(img, rectangles, previous) # Select rectangles
 
+    config = microscope.cached(config)
     regions = utils.rect2regions(rectangles, microscope.get_pixelsize(config)) # New window size
     # points = utils.get_rect_center(rectangles, microscope.get_pixelsize(config))
     points = utils.get_rect_center(rectangles, microscope.get_pixelsize(config), microscope.get_resolution(config))
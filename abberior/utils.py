@@ -1,13 +1,9 @@
 import sys
 
-from matplotlib import pyplot
-
 import numpy
 
-from scipy.optimize import curve_fit
-from scipy.spatial.distance import cdist
-
-from skimage import draw, filters
+# matplotlib, scipy and skimage are imported in the functions that need them
+# to keep `import abberior.utils` fast for headless workers
 
 
 def avg_area(img, radius, point):
@@ -43,6 +39,9 @@ def avg_signal(signal, radius, points):
 
 
 def gaussian_fit(img, start, end):
+    from scipy.optimize import curve_fit
+    from skimage import draw
+
     values = []
     for delta in [-1, 0, 1]:
         cc, rr = draw.line(*start, *end)
@@ -60,6 +59,7 @@ def gaussian_fit(img, start, end):
     except (RuntimeError, TypeError, NameError) as err:
         print("Gaussian fit failed")
         print(err)
+        from matplotlib import pyplot
         pyplot.figure("Failed to fit these data")
         pyplot.plot(positions, avg_values, "bo")
         pyplot.show(block=True)
@@ -127,15 +127,122 @@ def gauss2(x, y0, a, mu, sigma):
 
 
 def get_closer(last_options, last_preferred, options, metric):
+    from scipy.spatial.distance import cdist
     dists = cdist(options, [last_options[last_preferred]], metric=metric)
     return numpy.argmin(dists)
 
 
 def get_foreground(img):
+    from skimage import filters
     val = filters.threshold_otsu(img)
     return img > val
 
 
+def sharpness(img, method="brenner"):
+    '''Compute the sharpness of an image, e.g. to find the focus. The measure
+    is normalized by the mean intensity such that bleaching between images has
+    little effect.
+
+    :param img: An image (2d array) or an array of images whose last two axes
+                are the image axes, e.g. the stacks returned by `acquire`.
+    :param method: "brenner" for the squared differences of pixels 2 apart or
+                   "variance" for the normalized variance.
+
+    :returns: The sharpness, summed over the images.
+    '''
+    img = numpy.asarray(img, dtype=numpy.float64)
+    mean = img.mean(axis=(-2, -1))
+    mean = numpy.where(mean > 0, mean, 1.)
+    if method == "brenner":
+        dy = img[..., 2:, :] - img[..., :-2, :]
+        dx = img[..., :, 2:] - img[..., :, :-2]
+        value = ((dy ** 2).mean(axis=(-2, -1)) + (dx ** 2).mean(axis=(-2, -1))) / mean ** 2
+    elif method == "variance":
+        value = img.var(axis=(-2, -1)) / mean
+    else:
+        raise ValueError("Unknown sharpness method {}".format(method))
+    return float(numpy.sum(value))
+
+
+def hann_window(shape):
+    '''Compute a 2d Hann window, e.g. to avoid the edge effects of the FFT.
+
+    :param shape: A `tuple` of the (height, width) of the window.
+
+    :returns: A `numpy.ndarray` of the window.
+    '''
+    return numpy.outer(numpy.hanning(shape[0]), numpy.hanning(shape[1]))
+
+
+def windowed_fft(img, window=None):
+    '''Compute the FFT of an image for `phase_shift`. The mean is removed and
+    the image is multiplied by the window.
+
+    :param img: An image (2d array).
+    :param window: A window of the shape of the image (see `hann_window`).
+
+    :returns: The `numpy.fft.rfft2` of the image.
+    '''
+    img = numpy.asarray(img, dtype=numpy.float64)
+    img = img - img.mean()
+    if window is not None:
+        img = img * window
+    return numpy.fft.rfft2(img)
+
+
+def _subpixel_peak(left, center, right):
+    denominator = left - 2 * center + right
+    if denominator >= 0:
+        return 0.
+    return 0.5 * (left - right) / denominator
+
+
+def phase_shift(reference_fft, image_fft, shape):
+    '''Compute the translation between two images from their FFT by phase
+    correlation. The peak of the correlation is refined to sub-pixel precision
+    with a parabolic fit along each axis.
+
+    :param reference_fft: The FFT of the reference image (see `windowed_fft`).
+    :param image_fft: The FFT of the image.
+    :param shape: A `tuple` of the (height, width) of the images.
+
+    :returns: A `tuple` of the (dy, dx) shift (pixels) of the image with
+              respect to the reference.
+    '''
+    cross = image_fft * numpy.conj(reference_fft)
+    # Normalizing by the square root of the magnitude, rather than the
+    # magnitude, keeps a smooth peak that the parabolic fit locates precisely
+    cross /= numpy.sqrt(numpy.maximum(numpy.abs(cross), 1e-12))
+    correlation = numpy.fft.irfft2(cross, s=shape)
+    y, x = numpy.unravel_index(numpy.argmax(correlation), shape)
+    height, width = shape
+    dy = y + _subpixel_peak(correlation[(y - 1) % height, x], correlation[y, x], correlation[(y + 1) % height, x])
+    dx = x + _subpixel_peak(correlation[y, (x - 1) % width], correlation[y, x], correlation[y, (x + 1) % width])
+    # Shifts beyond half the image wrap around
+    if dy > height / 2:
+        dy -= height
+    if dx > width / 2:
+        dx -= width
+    return float(dy), float(dx)
+
+
+def phase_correlation(reference, image, window=True):
+    '''Compute the translation between two images by phase correlation.
+
+    :param reference: The reference image (2d array).
+    :param image: An image of the same shape.
+    :param window: If `True`, a Hann window is applied to the images.
+
+    :returns: A `tuple` of the (dy, dx) shift (pixels) of the image with
+              respect to the reference.
+    '''
+    reference, image = numpy.asarray(reference), numpy.asarray(image)
+    if reference.shape != image.shape:
+        raise ValueError("The images do not share the same shape: {} and {}".format(reference.shape, image.shape))
+    window = hann_window(reference.shape) if window else None
+    return phase_shift(windowed_fft(reference, window), windowed_fft(image, window), reference.shape)
+
+
 if __name__ == "__main__":
     import skimage.io
     path = "Test foreground background/35"
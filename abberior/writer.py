@@ -0,0 +1,166 @@
+'''
+This module implements a background writer for the Imspector measurements.
+'''
+
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+
+from concurrent.futures import Future
+
+from .metrics import registry
+
+class MeasurementWriter:
+    '''Saves measurements on a background thread.
+
+    A save request first takes a snapshot of the measurement, i.e. saves it
+    uncompressed to a temporary file, such that later acquisitions cannot
+    change what is saved. The snapshot is then written to the saving path on
+    the writer thread, compressed by reopening it in the application when one
+    is given, or moved otherwise. Only the snapshot delays the next
+    acquisition when the writer has an application of its own, i.e. a
+    separate connection to Imspector. Through the application of a
+    `microscope.Session`, the compression holds the lock of the session and
+    is thus interleaved with the acquisitions.
+
+    Requests are written in order. When `maxsize` requests are pending,
+    `submit` blocks until one is written (back-pressure). Each request returns
+    a `concurrent.futures.Future` that resolves to the saving path or raises
+    the error of the save.
+
+    Usage::
+
+        with MeasurementWriter() as writer:
+            stacks, elapsed, handle = microscope.acquire_saveasmsr(conf, path, writer=writer)
+    '''
+    def __init__(self, maxsize=4, tmpdir=None, application=None):
+        '''Instantiates the `MeasurementWriter`.
+
+        :param maxsize: The maximal number of pending requests.
+        :param tmpdir: A `str` of the directory of the snapshots, preferably on
+                       a fast local disk. Defaults to the temporary directory.
+        :param application: A separate connection to Imspector used to
+                            compress the snapshots, which must not be shared
+                            with the acquisitions.
+        '''
+        self.tmpdir = tmpdir
+        self.application = application
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="measurement-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            snapshot, savepath, compress, application, future = item
+            try:
+                if future.set_running_or_notify_cancel():
+                    start = time.perf_counter()
+                    try:
+                        self._write(snapshot, savepath, compress, application)
+                    except BaseException as err:
+                        future.set_exception(err)
+                    else:
+                        future.set_result(savepath)
+                    registry.record("save", save=time.perf_counter() - start, savepath=savepath)
+            finally:
+                # The snapshot is left behind by a failed or cancelled save
+                if os.path.exists(snapshot):
+                    os.remove(snapshot)
+                self._queue.task_done()
+
+    def _write(self, snapshot, savepath, compress, application):
+        if compress and application is not None:
+            measurement = application.open(snapshot)
+            try:
+                measurement.save_as(savepath, True)
+            finally:
+                application.close(measurement)
+        else:
+            shutil.move(snapshot, savepath)
+
+    def snapshot(self, measurement):
+        '''Saves the measurement uncompressed to a temporary file. No
+        acquisition should run meanwhile, e.g. the lock of the session should
+        be held.
+
+        :param measurement: A measurement object.
+
+        :returns: A `str` of the path of the snapshot.
+        '''
+        descriptor, path = tempfile.mkstemp(suffix=".msr", dir=self.tmpdir)
+        os.close(descriptor)
+        measurement.save_as(path, False)
+        return path
+
+    def enqueue(self, snapshot, savepath, compress=True, application=None):
+        '''Queues the writing of a snapshot. Blocks while the queue is full.
+
+        :param snapshot: A `str` of the path returned by `snapshot`.
+        :param savepath: A `str` of the saving path.
+        :param compress: A `bool` wheter to compress the data. The snapshot is
+                         moved uncompressed if no application is given.
+        :param application: The application used to reopen and compress the
+                            snapshot, defaults to the application of the
+                            writer. The reopened measurement is private to the
+                            writer.
+
+        :returns: A `concurrent.futures.Future`.
+        '''
+        if self._closed:
+            raise RuntimeError("Cannot submit to a closed MeasurementWriter.")
+        if application is None:
+            application = self.application
+        future = Future()
+        self._queue.put((snapshot, savepath, compress, application, future))
+        return future
+
+    def submit(self, measurement, savepath, compress=True, application=None):
+        '''Takes a snapshot of a measurement and queues its writing (see
+        `snapshot` and `enqueue`). Blocks while the queue is full.
+
+        :param measurement: A measurement object.
+        :param savepath: A `str` of the saving path.
+        :param compress: A `bool` wheter to compress the data.
+        :param application: The application used to compress the snapshot,
+                            defaults to the application of the writer.
+
+        :returns: A `concurrent.futures.Future`.
+        '''
+        if self._closed:
+            raise RuntimeError("Cannot submit to a closed MeasurementWriter.")
+        return self.enqueue(self.snapshot(measurement), savepath, compress, application)
+
+    def pending(self):
+        '''Returns the approximate number of pending save requests.
+
+        :returns: An `int`.
+        '''
+        return self._queue.qsize()
+
+    def flush(self):
+        '''Blocks until every queued measurement is written.
+        '''
+        self._queue.join()
+
+    def close(self):
+        '''Writes the queued measurements and stops the writer thread.
+        '''
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,49 @@
+'''
+Measures the time to import the modules of the package. Every import is timed
+in a fresh interpreter such that the modules are not cached.
+
+    python benchmarks/import_time.py --repeat 5
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+
+import numpy
+
+MODULES = ("abberior", "abberior.utils", "abberior.microscope", "abberior.user")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def time_import(module, statement=None):
+    '''Time the import of a module in a new interpreter.
+
+    :param module: A `str` of the name of the module.
+    :param statement: A `str` of Python code to time after the import.
+
+    :returns: A `float` of the duration (seconds).
+    '''
+    code = "\n".join([
+        "import time",
+        "start = time.perf_counter()",
+        "import {}".format(module),
+        statement or "",
+        "print(time.perf_counter() - start)",
+    ])
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Measures the import time of the package")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cases = [(module, None) for module in MODULES]
+    cases.append(("abberior.microscope", "abberior.microscope.get_measurement()"))
+    for module, statement in cases:
+        times = [time_import(module, statement) for _ in range(args.repeat)]
+        label = module if statement is None else statement
+        print("{:<45} median {:8.1f} ms   min {:8.1f} ms".format(
+            label, numpy.median(times) * 1e3, numpy.min(times) * 1e3))
@@ -0,0 +1,74 @@
+'''
+Loopback tests of the acquisition server against the debug `Imspector`.
+'''
+
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+from abberior import microscope
+from abberior.server import AcquisitionServer, AcquisitionClient, encode
+
+NUM_FRAMES = 20
+T_RES = "ExpControl/scan/range/t/res"
+
+@pytest.fixture
+def server():
+    loop = asyncio.new_event_loop()
+    server = AcquisitionServer(port=0)
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert started.wait(10)
+    conf = microscope.get_measurement().active_configuration()
+    num_frames = conf.parameters(T_RES)
+    conf.set_parameters(T_RES, NUM_FRAMES)
+    yield server
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+    conf.set_parameters(T_RES, num_frames)
+
+def test_acquire(server):
+    with AcquisitionClient(port=server.port, timeout=10) as client:
+        stacks, elapsed = client.acquire()
+        assert stacks.ndim == 4
+        assert client.parameters(T_RES) == NUM_FRAMES
+
+def test_stream_frames(server):
+    with AcquisitionClient(port=server.port, timeout=10) as client:
+        indices = [index for index, _, frame in client.stream_frames()]
+        assert indices == list(range(NUM_FRAMES))
+        assert client.parameters(T_RES) == NUM_FRAMES
+
+def test_stream_frames_closed_early(server):
+    with AcquisitionClient(port=server.port, timeout=10) as client:
+        for index, _, _ in client.stream_frames():
+            if index == 2:
+                break
+        # The next reply is not a leftover frame
+        assert client.parameters(T_RES) == NUM_FRAMES
+
+def test_client_disconnect(server):
+    sock = socket.create_connection(("127.0.0.1", server.port), timeout=10)
+    sock.sendall(encode({"command" : "stream_frames", "id" : 1, "buffer" : 1}))
+    sock.recv(1024)
+    sock.close()
+
+    with AcquisitionClient(port=server.port, timeout=10) as client:
+        stacks, _ = client.acquire()
+        assert stacks.ndim == 4
+        deadline = time.time() + 10
+        while client.parameters(T_RES) != NUM_FRAMES and time.time() < deadline:
+            time.sleep(0.05)
+        assert client.parameters(T_RES) == NUM_FRAMES